@@ -1,11 +1,100 @@
+from typing import Literal, Optional
+
 from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
     DATABASE_URL: str = "postgresql+asyncpg://"
+    # 只读从库, 为空时所有查询走主库
+    DATABASE_REPLICA_URL: Optional[str] = None
+    REPLICA_MAX_LAG: float = 5
+    REPLICA_CHECK_INTERVAL: float = 5
+    # 连接池配置
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_PRE_PING: bool = False
+    DB_POOL_RECYCLE: int = -1
+    # asyncpg 预编译语句缓存大小, 0 为关闭(使用 pgbouncer 事务模式时需要)
+    DB_STATEMENT_CACHE_SIZE: int = 100
+
     SECRET_KEY: str = ""
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # 已认证用户缓存
+    PRINCIPAL_CACHE_SIZE: int = 1024
+    PRINCIPAL_CACHE_TTL: int = 60
+    # 密码哈希线程数与 bcrypt 成本因子
+    PASSWORD_HASH_WORKERS: int = 2
+    BCRYPT_ROUNDS: int = 12
+
+    # 响应模型类型完全匹配时跳过二次校验, 直接序列化
+    FAST_RESPONSES: bool = True
+
+    # 上传写缓冲: immediate 入队即返回, flush 等待批量写入完成后返回
+    INGEST_BUFFER_ENABLED: bool = True
+    INGEST_FLUSH_ROWS: int = 500
+    INGEST_FLUSH_INTERVAL_MS: int = 200
+    INGEST_DURABILITY: Literal["immediate", "flush"] = "flush"
+    # 缓冲区待写入行数上限, 超过后上传直接返回错误
+    INGEST_MAX_PENDING_ROWS: int = 50000
+
+    # 序列号 -> 设备 缓存
+    DEVICE_CACHE_SIZE: int = 10000
+    DEVICE_CACHE_TTL: int = 300
+    # 心跳批量写入间隔与离线判定超时(秒)
+    PRESENCE_FLUSH_INTERVAL: int = 5
+    DEVICE_OFFLINE_TIMEOUT: int = 120
+    # 位置/设备类型维表缓存
+    DIMENSION_CACHE_TTL: int = 300
+
+    # 分页总数缓存
+    COUNT_CACHE_SIZE: int = 1024
+    COUNT_CACHE_TTL: int = 10
+
+    # 聚合查询单次最多返回的时间桶数量
+    AGGREGATE_MAX_BUCKETS: int = 10000
+    # 写入时增量维护分钟/小时/天汇总表
+    ROLLUPS_ENABLED: bool = True
+    # 汇总表后台合并写入间隔
+    ROLLUP_FLUSH_INTERVAL_MS: int = 1000
+
+    # 实时推送: 每个订阅者缓冲的帧数(满时丢弃最旧的), 订阅者上限, SSE 保活间隔(秒)
+    LIVE_BUFFER_FRAMES: int = 100
+    LIVE_MAX_SUBSCRIBERS: int = 1000
+    LIVE_KEEPALIVE: int = 15
+
+    # 导出时每批从游标读取的行数
+    EXPORT_CHUNK_ROWS: int = 5000
+
+    # environment_data 按月分区, 需先执行 python -m db.partitions convert
+    PARTITIONING_ENABLED: bool = False
+    PARTITION_MONTHS_AHEAD: int = 3
+    PARTITION_MAINTENANCE_INTERVAL: int = 6 * 3600
+    # 保留月数, 0 表示永久保留
+    DATA_RETENTION_MONTHS: int = 0
+
+    MQTT_HOST: str = "w99564f6.ala.cn-hangzhou.emqxsl.cn"
+    MQTT_PORT: int = 8883
+    MQTT_SSL: bool = True
+    MQTT_USERNAME: str = "sensor"
+    MQTT_PASSWORD: str = "B2w.N_KaRWp:Nye"
+    MQTT_RECONNECT_RETRIES: int = 10
+    MQTT_RECONNECT_DELAY: int = 5
+    # 传感器上报主题, '+' 层级为设备序列号
+    MQTT_SENSOR_TOPICS: list[str] = ["/sensors/+/lth"]
+    MQTT_SENSOR_QOS: int = 0
+    MQTT_INGEST_QUEUE_SIZE: int = 10000
+    MQTT_INGEST_WORKERS: int = 2
+    MQTT_INGEST_BATCH_ROWS: int = 500
+    # 设备命令主题模板, {type} 为设备类型名称, {serial_number} 为设备序列号
+    COMMAND_TOPIC_TEMPLATE: str = "/actuators/{type}/{serial_number}"
+    # 设备回报确认的主题, 最后一个 '+' 层级为设备序列号, 负载为 {"id": 命令 id, "status": "ok" | "error", "message": ...}
+    COMMAND_ACK_TOPICS: list[str] = ["/actuators/+/+/ack"]
+    COMMAND_QOS: int = 1
+    # 确认超时与超时扫描间隔(秒)
+    COMMAND_ACK_TIMEOUT: int = 10
+    COMMAND_SWEEP_INTERVAL: int = 5
 
 
 settings = Settings()
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from config import settings
+from models.data import EnvironmentData
+from models.rollups import ROLLUPS, RollupCoverage
+from schemas.data_schema import DataAggregate, MetricStats
+
+BUCKET_WIDTHS = {
+    "1m": timedelta(minutes=1),
+    "5m": timedelta(minutes=5),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+# date_bin 的对齐起点
+BUCKET_ORIGIN = datetime(2000, 1, 1)
+
+METRICS = ("temperature", "humidity", "illuminance")
+
+
+def bucket_floor(timestamp: datetime, width: timedelta) -> datetime:
+    origin = BUCKET_ORIGIN.replace(tzinfo=timestamp.tzinfo)
+    return origin + (timestamp - origin) // width * width
+
+
+def _select_source(start: datetime, end: datetime, width: timedelta, coverage: dict[str, datetime]):
+    # 选择满足分辨率、与查询区间对齐且覆盖整个区间的最粗汇总表, 都不满足时查询原始数据
+    if settings.ROLLUPS_ENABLED:
+        for rollup_width, model in reversed(ROLLUPS):
+            covered_since = coverage.get(model.__tablename__)
+            if (covered_since is not None
+                    and start >= covered_since.replace(tzinfo=start.tzinfo)
+                    and width % rollup_width == timedelta(0)
+                    and bucket_floor(start, rollup_width) == start
+                    and bucket_floor(end, rollup_width) == end):
+                return model
+    return None
+
+
+async def aggregate_readings(
+        db: AsyncSession,
+        device_id: int | None,
+        location_id: int | None,
+        start: datetime,
+        end: datetime,
+        width: timedelta,
+) -> list[DataAggregate]:
+    # 在数据库中按时间桶聚合, 只返回有数据的桶
+    coverage = {}
+    if settings.ROLLUPS_ENABLED:
+        coverage = dict((await db.execute(select(RollupCoverage.name, RollupCoverage.covered_since))).all())
+    model = _select_source(start, end, width, coverage)
+    if model is None:
+        model = EnvironmentData
+        timestamp = EnvironmentData.timestamp
+        count = func.count()
+    else:
+        timestamp = model.bucket
+        count = func.sum(model.count)
+    bucket = func.date_bin(width, timestamp, BUCKET_ORIGIN, type_=DateTime).label("bucket")
+    columns = [bucket, count.label("count")]
+    for metric in METRICS:
+        if model is EnvironmentData:
+            column = getattr(EnvironmentData, metric)
+            columns += [
+                func.min(column).label(f"{metric}_min"),
+                func.max(column).label(f"{metric}_max"),
+                func.avg(column).label(f"{metric}_avg"),
+            ]
+        else:
+            columns += [
+                func.min(getattr(model, f"{metric}_min")).label(f"{metric}_min"),
+                func.max(getattr(model, f"{metric}_max")).label(f"{metric}_max"),
+                (func.sum(getattr(model, f"{metric}_sum")) / func.nullif(func.sum(model.count), 0))
+                .label(f"{metric}_avg"),
+            ]
+    # 动态构建过滤条件列表
+    filters = [timestamp >= start, timestamp < end]
+    if location_id is not None:
+        filters.append(model.location_id == location_id)
+    if device_id is not None:
+        filters.append(model.device_id == device_id)
+    query = (select(*columns)
+             .where(and_(*filters))
+             .group_by(bucket)
+             .order_by(bucket))
+    result = await db.execute(query)
+    items = []
+    for row in result:
+        stats = {
+            metric: MetricStats(
+                min=getattr(row, f"{metric}_min"),
+                max=getattr(row, f"{metric}_max"),
+                avg=getattr(row, f"{metric}_avg"),
+            )
+            for metric in METRICS
+        }
+        items.append(DataAggregate(bucket=row.bucket, count=row.count, **stats))
+    return items
+
+
+def fill_gaps(items: list[DataAggregate], start: datetime, end: datetime, width: timedelta) -> list[DataAggregate]:
+    # 补齐没有数据的时间桶, count 为 0, 统计值为空
+    existing = {item.bucket: item for item in items}
+    filled = []
+    bucket = bucket_floor(start, width)
+    while bucket < end:
+        item = existing.get(bucket)
+        if item is None:
+            item = DataAggregate(bucket=bucket, count=0, **{metric: MetricStats() for metric in METRICS})
+        filled.append(item)
+        bucket += width
+    return filled
@@ -0,0 +1,114 @@
+from typing import Iterable
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from config import settings
+from models.data import EnvironmentData
+from models.devices import Device
+from schemas.device_schema import DeviceUpload, LTHData
+from utils.cache import TTLCache
+from utils.dimensions import dimensions
+from utils.latest import latest_readings
+from utils.live import live_hub
+from utils.rollup_aggregator import rollup_aggregator
+
+# serial_number -> (device_id, location_id)
+device_cache = TTLCache(maxsize=settings.DEVICE_CACHE_SIZE, ttl=settings.DEVICE_CACHE_TTL)
+# device_id -> name
+name_cache = TTLCache(maxsize=settings.DEVICE_CACHE_SIZE, ttl=settings.DEVICE_CACHE_TTL)
+
+
+async def resolve_devices(db: AsyncSession, serial_numbers: Iterable[str]) -> dict[str, tuple[int, int | None]]:
+    # 先查缓存, 未命中的序列号一次查询解析 -> (device_id, location_id)
+    devices = {}
+    missing = set()
+    for serial_number in set(serial_numbers):
+        device = device_cache.get(serial_number)
+        if device is None:
+            missing.add(serial_number)
+        else:
+            devices[serial_number] = device
+    if not missing:
+        return devices
+    query = (select(Device.serial_number, Device.id, Device.location_id)
+             .where(Device.serial_number.in_(missing)))
+    result = await db.execute(query)
+    for row in result:
+        device = (row.id, row.location_id)
+        device_cache.set(row.serial_number, device)
+        devices[row.serial_number] = device
+    return devices
+
+
+async def resolve_names(db: AsyncSession, device_ids: Iterable[int], location_ids: Iterable[int | None]) \
+        -> tuple[dict[int, str], dict[int, str]]:
+    # 设备名称先查缓存, 未命中的一次查询补齐; 位置名称由维表缓存解析
+    device_names = {}
+    missing_devices = set()
+    for device_id in set(device_ids):
+        name = name_cache.get(device_id)
+        if name is None:
+            missing_devices.add(device_id)
+        else:
+            device_names[device_id] = name
+    if missing_devices:
+        result = await db.execute(select(Device.id, Device.name).where(Device.id.in_(missing_devices)))
+        for row in result:
+            name_cache.set(row.id, row.name)
+            device_names[row.id] = row.name
+    location_ids = set(location_ids)
+    await dimensions.ensure(location_ids=location_ids)
+    location_names = {location_id: dimensions.location_name(location_id)
+                      for location_id in location_ids if location_id in dimensions.locations}
+    return device_names, location_names
+
+
+def upload_error(upload_data: DeviceUpload[LTHData]) -> str | None:
+    # 写入前逐条检查, 避免一行无效数据导致整批插入失败
+    if upload_data.message is None:
+        return "Empty message."
+    if upload_data.timestamp is None:
+        return "Missing timestamp."
+    return None
+
+
+def build_reading(upload_data: DeviceUpload[LTHData], device_id: int, location_id: int | None) -> dict:
+    return {
+        "device_id": device_id,
+        "timestamp": upload_data.timestamp,
+        "temperature": upload_data.message.temp,
+        "humidity": upload_data.message.humi,
+        "illuminance": upload_data.message.lux,
+        "location_id": location_id,
+    }
+
+
+async def write_readings(db: AsyncSession, rows: list[dict]) -> list[int]:
+    # 多行插入, 一个事务提交, 按参数顺序返回主键
+    if not rows:
+        return []
+    query = insert(EnvironmentData).returning(EnvironmentData.id, sort_by_parameter_order=True)
+    result = await db.execute(query, rows)
+    ids = list(result.scalars())
+    await db.commit()
+    return ids
+
+
+def publish_readings(rows: list[dict], ids: list[int]):
+    # 提交后的内存副作用, 出错只记录日志, 不能让调用方把已提交的数据再写一遍
+    if settings.ROLLUPS_ENABLED:
+        # 汇总表由后台任务合并写入, 不占用原始数据的写入事务
+        rollup_aggregator.add(rows)
+    try:
+        latest_readings.update(rows, ids)
+        live_hub.publish(rows, ids, name_cache)
+    except Exception as exc:
+        print("Publish readings failed: ", exc)
+
+
+async def insert_readings(db: AsyncSession, rows: list[dict]) -> list[int]:
+    ids = await write_readings(db, rows)
+    publish_readings(rows, ids)
+    return ids
@@ -1,10 +1,155 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import time
+
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from config import settings
 
-async_engine = create_async_engine(settings.DATABASE_URL)
+
+class PoolMetrics:
+    def __init__(self):
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, wait: float):
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def stats(self, pool) -> dict:
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "connects": self.connects,
+            "closes": self.closes,
+            "invalidations": self.invalidations,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "timeouts": self.timeouts,
+            "wait_total": self.wait_total,
+            "wait_avg": self.wait_total / self.checkouts if self.checkouts else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        # 记录等待空闲连接的时间
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.record_wait(time.perf_counter() - start)
+
+
+def _listen_pool(engine: AsyncEngine, metrics: PoolMetrics):
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        metrics.connects += 1
+
+    @event.listens_for(sync_engine, "close")
+    def close(dbapi_connection, connection_record):
+        metrics.closes += 1
+
+    @event.listens_for(sync_engine, "invalidate")
+    def invalidate(dbapi_connection, connection_record, exception):
+        metrics.invalidations += 1
+
+    @event.listens_for(sync_engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.checkouts += 1
+
+    @event.listens_for(sync_engine, "checkin")
+    def checkin(dbapi_connection, connection_record):
+        metrics.checkins += 1
+
+
+# engine 名称 -> (engine, metrics)
+engines: dict[str, tuple[AsyncEngine, PoolMetrics]] = {}
+
+
+def create_engine(name: str, url: str) -> AsyncEngine:
+    metrics = PoolMetrics()
+    # 每个 engine 使用独立的连接池子类, 连接池重建(dispose)后仍保留统计对象
+    poolclass = type("InstrumentedPool", (InstrumentedPool,), {"metrics": metrics})
+    options = {
+        "poolclass": poolclass,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+    }
+    if make_url(url).get_driver_name() == "asyncpg":
+        options["connect_args"] = {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+    engine = create_async_engine(url, **options)
+    _listen_pool(engine, metrics)
+    engines[name] = (engine, metrics)
+    return engine
+
+
+def pool_stats() -> dict:
+    return {name: metrics.stats(engine.sync_engine.pool) for name, (engine, metrics) in engines.items()}
+
+
+async_engine = create_engine("primary", settings.DATABASE_URL)
+read_engine = create_engine("replica", settings.DATABASE_REPLICA_URL) if settings.DATABASE_REPLICA_URL else None
+
+# 从库回放进度追平时延迟为 0; 非从库实例上这些函数返回 NULL, 同样视为 0
+REPLICA_LAG_QUERY = text(
+    "SELECT COALESCE(CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END, 0)"
+)
+replica_health = {"healthy": False, "lag": None, "checked_at": 0.0, "fallbacks": 0}
+
+
+async def replica_available() -> bool:
+    # 按间隔检查从库可用性与复制延迟, 期间的请求沿用上次结果
+    if read_engine is None:
+        return False
+    now = time.monotonic()
+    if now - replica_health["checked_at"] >= settings.REPLICA_CHECK_INTERVAL:
+        replica_health["checked_at"] = now
+        try:
+            async with read_engine.connect() as connection:
+                lag = float((await connection.execute(REPLICA_LAG_QUERY)).scalar_one())
+            replica_health["lag"] = lag
+            replica_health["healthy"] = lag <= settings.REPLICA_MAX_LAG
+        except Exception as exc_info:
+            print("Replica check failed: ", exc_info)
+            replica_health["lag"] = None
+            replica_health["healthy"] = False
+    if not replica_health["healthy"]:
+        replica_health["fallbacks"] += 1
+    return replica_health["healthy"]
+
+
+async def get_read_engine() -> AsyncEngine:
+    return read_engine if await replica_available() else async_engine
 
 
 async def get_db():
     async with AsyncSession(async_engine, expire_on_commit=False) as session:
         yield session
+
+
+async def get_read_db():
+    # 只读查询优先走从库, 从库不可用或延迟过大时回退主库
+    async with AsyncSession(await get_read_engine(), expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+from datetime import date, datetime
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from config import settings
+from db.operations import async_engine
+from models.data import EnvironmentData
+
+PARENT_TABLE = "environment_data"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_{month.year:04d}_{month.month:02d}"
+
+
+async def _table_exists(connection: AsyncConnection, name: str) -> bool:
+    return (await connection.execute(text("SELECT to_regclass(:name)"), {"name": name})).scalar_one() is not None
+
+
+async def _create_partition(connection: AsyncConnection, month: date, upper: date):
+    name = partition_name(month)
+    if await _table_exists(connection, name):
+        return
+    bounds = f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+    if not await _table_exists(connection, DEFAULT_PARTITION):
+        await connection.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} {bounds}"))
+        return
+    # 默认分区中已有该月数据时直接 PARTITION OF 会失败, 先建普通表迁入这些行再挂载
+    await connection.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS)"))
+    await connection.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :lower AND timestamp < :upper "
+        f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+    ), {"lower": month, "upper": upper})
+    await connection.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} {bounds}"))
+
+
+async def ensure_partitions(connection: AsyncConnection, months_ahead: int, since: date | None = None):
+    # 按月创建分区, 覆盖 since(默认当月) 到未来 months_ahead 个月
+    current = date.today().replace(day=1)
+    month = (since or current).replace(day=1)
+    last = _add_months(current, months_ahead)
+    while month <= last:
+        upper = _add_months(month, 1)
+        await _create_partition(connection, month, upper)
+        month = upper
+    await connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"
+    ))
+
+
+async def drop_expired_partitions(connection: AsyncConnection, retention_months: int) -> list[str]:
+    # 整个分区过期后直接删除, 不逐行 DELETE
+    if retention_months <= 0:
+        return []
+    cutoff = _add_months(date.today().replace(day=1), -retention_months)
+    result = await connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+        "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+        "WHERE parent.relname = :parent"
+    ), {"parent": PARENT_TABLE})
+    dropped = []
+    for name in result.scalars():
+        suffix = name[len(PARENT_TABLE) + 1:]
+        try:
+            month = datetime.strptime(suffix, "%Y_%m").date()
+        except ValueError:
+            continue
+        if _add_months(month, 1) <= cutoff:
+            await connection.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+            await connection.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    # 默认分区不会整体过期, 其中的过期行逐行删除
+    if await _table_exists(connection, DEFAULT_PARTITION):
+        result = await connection.execute(
+            text(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < :cutoff"), {"cutoff": cutoff})
+        if result.rowcount:
+            print("Deleted expired rows from", DEFAULT_PARTITION, result.rowcount)
+    return dropped
+
+
+async def ensure_default_partition():
+    # 模型始终声明为分区表, create_all 建出的父表没有任何分区, 无论是否启用按月分区都补上默认分区
+    async with async_engine.begin() as connection:
+        partitioned = (await connection.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:name))"
+        ), {"name": PARENT_TABLE})).scalar_one()
+        if partitioned:
+            await connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"
+            ))
+
+
+async def ensure_data_indexes():
+    # create_all 不会给已存在的表补建索引, 启动时按模型补齐 keyset 分页与最新数据查询依赖的索引
+    async with async_engine.begin() as connection:
+        for index in EnvironmentData.__table__.indexes:
+            await connection.run_sync(index.create, checkfirst=True)
+
+
+async def maintain_partitions() -> list[str]:
+    # 建分区与过期清理分别提交, 建分区失败不影响保留策略
+    try:
+        async with async_engine.begin() as connection:
+            await ensure_partitions(connection, settings.PARTITION_MONTHS_AHEAD)
+    except Exception as exc:
+        print("Partition creation failed: ", exc)
+    async with async_engine.begin() as connection:
+        return await drop_expired_partitions(connection, settings.DATA_RETENTION_MONTHS)
+
+
+async def convert_table():
+    # 将现有的普通表迁移为按月分区表, 原表保留为 environment_data_legacy
+    legacy = f"{PARENT_TABLE}_legacy"
+    async with async_engine.begin() as connection:
+        await connection.execute(text(f"ALTER TABLE {PARENT_TABLE} RENAME TO {legacy}"))
+        for index in ("ix_environment_data_timestamp_id", "ix_environment_data_device_timestamp_id"):
+            await connection.execute(text(f"ALTER INDEX IF EXISTS {index} RENAME TO {index}_legacy"))
+        await connection.execute(text(
+            f"CREATE TABLE {PARENT_TABLE} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)"
+        ))
+        await connection.execute(text(f"ALTER TABLE {PARENT_TABLE} ADD PRIMARY KEY (id, timestamp)"))
+        # 自增序列转到新表名下, 删除 legacy 表时不会被一并删除
+        sequence = (await connection.execute(
+            text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": legacy}
+        )).scalar_one()
+        if sequence:
+            await connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {PARENT_TABLE}.id"))
+        await connection.execute(text(
+            f"ALTER TABLE {PARENT_TABLE} ADD FOREIGN KEY (device_id) REFERENCES devices (id)"
+        ))
+        await connection.execute(text(
+            f"ALTER TABLE {PARENT_TABLE} ADD FOREIGN KEY (location_id) REFERENCES locations (id)"
+        ))
+        await connection.execute(text(
+            f"CREATE INDEX ix_environment_data_timestamp_id ON {PARENT_TABLE} (timestamp, id)"
+        ))
+        await connection.execute(text(
+            f"CREATE INDEX ix_environment_data_device_timestamp_id ON {PARENT_TABLE} (device_id, timestamp, id)"
+        ))
+        oldest = (await connection.execute(text(f"SELECT min(timestamp) FROM {legacy}"))).scalar_one()
+        await ensure_partitions(connection, settings.PARTITION_MONTHS_AHEAD, oldest.date() if oldest else None)
+        await connection.execute(text(f"INSERT INTO {PARENT_TABLE} SELECT * FROM {legacy}"))
+    print("Converted", PARENT_TABLE, "legacy data kept in", legacy)
+
+
+async def run_maintenance(interval: float):
+    while True:
+        try:
+            dropped = await maintain_partitions()
+            if dropped:
+                print("Dropped expired partitions: ", dropped)
+        except Exception as exc:
+            print("Partition maintenance failed: ", exc)
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="环境数据分区维护")
+    parser.add_argument("command", choices=["convert", "maintain"])
+    args = parser.parse_args()
+    if args.command == "convert":
+        asyncio.run(convert_table())
+    else:
+        print("Dropped:", asyncio.run(maintain_partitions()))
@@ -0,0 +1,86 @@
+from sqlalchemy import and_
+from sqlalchemy.engine import Row
+from sqlalchemy.sql import Select
+from sqlmodel import select
+
+from models.data import EnvironmentData
+from models.devices import Device
+from schemas.data_schema import DataList
+from schemas.device_schema import DeviceList, DeviceStatusList
+from utils.dimensions import dimensions
+
+
+# 只查询列表需要的列, 位置/类型名称由内存维表解析, 避免 ORM 实体和额外的关联查询
+def data_list_query(filters: list) -> Select:
+    return (select(EnvironmentData.id,
+                   Device.name.label("device_name"),
+                   EnvironmentData.timestamp,
+                   EnvironmentData.temperature,
+                   EnvironmentData.humidity,
+                   EnvironmentData.illuminance,
+                   EnvironmentData.location_id)
+            .join(Device, EnvironmentData.device_id == Device.id)
+            .where(and_(*filters)))
+
+
+def device_list_query(filters: list) -> Select:
+    return (select(Device.id,
+                   Device.name,
+                   Device.type_id,
+                   Device.location_id,
+                   Device.mac_address,
+                   Device.serial_number,
+                   Device.firmware_version,
+                   Device.created_at,
+                   Device.is_online,
+                   Device.last_online)
+            .where(and_(*filters)))
+
+
+# 数据库中的数据可信, 直接构造模型跳过重复校验
+async def data_items(rows: list[Row]) -> list[DataList]:
+    await dimensions.ensure(location_ids=(row.location_id for row in rows))
+    return [
+        DataList.model_construct(
+            id=row.id,
+            device_name=row.device_name,
+            timestamp=row.timestamp,
+            temperature=row.temperature,
+            humidity=row.humidity,
+            illuminance=row.illuminance,
+            location_name=dimensions.location_name(row.location_id),
+        )
+        for row in rows
+    ]
+
+
+def _device_fields(row: Row) -> dict:
+    return {
+        "id": row.id,
+        "name": row.name,
+        "type_name": dimensions.type_name(row.type_id),
+        "location_name": dimensions.location_name(row.location_id),
+        "mac_address": row.mac_address,
+        "serial_number": row.serial_number,
+        "firmware_version": row.firmware_version,
+        "created_at": row.created_at,
+        "is_online": row.is_online,
+        "last_online": row.last_online,
+    }
+
+
+async def device_items(rows: list[Row]) -> list[DeviceList]:
+    await dimensions.ensure(location_ids=(row.location_id for row in rows), type_ids=(row.type_id for row in rows))
+    return [DeviceList.model_construct(**_device_fields(row)) for row in rows]
+
+
+async def device_status_items(rows: list[Row]) -> list[DeviceStatusList]:
+    await dimensions.ensure(location_ids=(row.location_id for row in rows), type_ids=(row.type_id for row in rows))
+    return [
+        DeviceStatusList.model_construct(
+            **_device_fields(row),
+            status="online" if row.is_online else "offline",
+            operation=dimensions.capabilities(row.type_id) or "",
+        )
+        for row in rows
+    ]
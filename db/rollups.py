@@ -0,0 +1,139 @@
+import argparse
+import asyncio
+import functools
+from datetime import datetime
+
+from sqlalchemy import func, DateTime, delete, insert, inspect
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import SQLModel, select
+
+from db.aggregate import BUCKET_ORIGIN, METRICS, bucket_floor
+from db.operations import async_engine
+from models.data import EnvironmentData
+from models.rollups import ROLLUPS, RollupCoverage
+
+
+def accumulate(groups: dict[tuple, dict], rows: list[dict], width):
+    # 把原始行合并进 (device_id, bucket) -> 汇总值
+    for row in rows:
+        key = (row["device_id"], bucket_floor(row["timestamp"], width))
+        group = groups.get(key)
+        if group is None:
+            group = {"device_id": key[0], "bucket": key[1], "count": 0}
+            for metric in METRICS:
+                group[f"{metric}_sum"] = None
+                group[f"{metric}_min"] = None
+                group[f"{metric}_max"] = None
+            groups[key] = group
+        group["location_id"] = row["location_id"]
+        group["count"] += 1
+        for metric in METRICS:
+            value = row[metric]
+            if value is None:
+                continue
+            current = group[f"{metric}_sum"]
+            group[f"{metric}_sum"] = value if current is None else current + value
+            current = group[f"{metric}_min"]
+            group[f"{metric}_min"] = value if current is None else min(current, value)
+            current = group[f"{metric}_max"]
+            group[f"{metric}_max"] = value if current is None else max(current, value)
+
+
+@functools.cache
+def _upsert_query(table):
+    # 每张汇总表只构建一次语句, 以 executemany 参数执行, 可复用 SQLAlchemy 编译缓存
+    query = pg_insert(table)
+    excluded = query.excluded
+    updates = {
+        "location_id": excluded.location_id,
+        "count": table.c.count + excluded.count,
+    }
+    for metric in METRICS:
+        column_sum = f"{metric}_sum"
+        updates[column_sum] = func.coalesce(table.c[column_sum] + excluded[column_sum],
+                                            table.c[column_sum], excluded[column_sum])
+        updates[f"{metric}_min"] = func.least(table.c[f"{metric}_min"], excluded[f"{metric}_min"])
+        updates[f"{metric}_max"] = func.greatest(table.c[f"{metric}_max"], excluded[f"{metric}_max"])
+    return query.on_conflict_do_update(index_elements=[table.c.device_id, table.c.bucket], set_=updates)
+
+
+async def upsert_rollups(db: AsyncSession, groups: dict[type, dict[tuple, dict]]):
+    # 合并到各级汇总表, 按主键排序避免并发 upsert 相互死锁
+    for _, model in ROLLUPS:
+        model_groups = groups.get(model)
+        if model_groups:
+            await db.execute(_upsert_query(model.__table__), [model_groups[key] for key in sorted(model_groups)])
+
+
+def _coverage_upsert(name: str, covered_since: datetime, widen: bool):
+    # widen 为真时覆盖范围只向前扩展, 否则仅在没有记录时写入
+    query = pg_insert(RollupCoverage).values(name=name, covered_since=covered_since)
+    if widen:
+        return query.on_conflict_do_update(
+            index_elements=[RollupCoverage.name],
+            set_={"covered_since": func.least(RollupCoverage.covered_since, query.excluded.covered_since)},
+        )
+    return query.on_conflict_do_nothing(index_elements=[RollupCoverage.name])
+
+
+async def create_rollup_tables():
+    tables = [model.__table__ for _, model in ROLLUPS] + [RollupCoverage.__table__]
+    now = datetime.now()
+    async with async_engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all, tables=tables)
+        # 没有覆盖记录的汇总表只保证下一个桶起的数据完整, 历史数据需执行 rebuild 回填
+        for width, model in ROLLUPS:
+            await connection.execute(_coverage_upsert(model.__tablename__, bucket_floor(now, width) + width, False))
+
+
+async def clear_rollup_coverage():
+    # 关闭增量维护期间写入的数据不会进入汇总表, 覆盖范围作废, 重新启用后需 rebuild 回填
+    async with async_engine.begin() as connection:
+        if await connection.run_sync(lambda sync_connection: inspect(sync_connection).has_table(
+                RollupCoverage.__tablename__)):
+            await connection.execute(delete(RollupCoverage))
+
+
+async def rebuild_rollups(since: datetime | None = None):
+    # 从原始数据重建汇总表, since 为空时全部重建
+    await create_rollup_tables()
+    async with AsyncSession(async_engine) as db:
+        for width, model in ROLLUPS:
+            bucket = func.date_bin(width, EnvironmentData.timestamp, BUCKET_ORIGIN, type_=DateTime).label("bucket")
+            columns = [
+                EnvironmentData.device_id,
+                bucket,
+                func.max(EnvironmentData.location_id),
+                func.count(),
+            ]
+            for metric in METRICS:
+                column = getattr(EnvironmentData, metric)
+                columns += [func.sum(column), func.min(column), func.max(column)]
+            query_source = select(*columns).group_by(EnvironmentData.device_id, bucket)
+            query_delete = delete(model)
+            if since is not None:
+                since_bucket = bucket_floor(since, width)
+                query_source = query_source.where(EnvironmentData.timestamp >= since_bucket)
+                query_delete = query_delete.where(model.bucket >= since_bucket)
+            targets = ["device_id", "bucket", "location_id", "count"]
+            for metric in METRICS:
+                targets += [f"{metric}_sum", f"{metric}_min", f"{metric}_max"]
+            await db.execute(query_delete)
+            await db.execute(insert(model).from_select(targets, query_source))
+            # 重建区间起的数据已完整
+            covered_since = bucket_floor(since, width) if since is not None else datetime.min
+            await db.execute(_coverage_upsert(model.__tablename__, covered_since, True))
+            await db.commit()
+            print("Rebuilt", model.__tablename__)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="环境数据汇总表维护")
+    parser.add_argument("command", choices=["create", "rebuild"])
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None)
+    args = parser.parse_args()
+    if args.command == "create":
+        asyncio.run(create_rollup_tables())
+    else:
+        asyncio.run(rebuild_rollups(args.since))
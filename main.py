@@ -1,23 +1,68 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Body
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.params import Query
-from fastapi_mqtt import FastMQTT, MQTTConfig
-
-from routers import user_api, utils_api, device_api, data_api, location_api
+from fastapi.responses import PlainTextResponse
+
+from config import settings
+from db.ingest import device_cache, name_cache
+from db.operations import pool_stats
+from db.partitions import run_maintenance, ensure_default_partition, ensure_data_indexes
+from db.rollups import create_rollup_tables, clear_rollup_coverage
+from routers import user_api, utils_api, device_api, data_api, location_api, command_api
 from schemas.data_schema import Command
 from schemas.responses_schema import Responses
+from utils.commands import command_bus
+from utils.dimensions import dimensions
+from utils.ingest_buffer import ingest_buffer
+from utils.live import live_hub
+from utils.metrics import MetricsMiddleware, instrument_engines, registry, MQTT_RECEIVED, MQTT_PUBLISHED
+from utils.mqtt import mqtt
+from utils.mqtt_ingest import mqtt_ingest
+from utils.pagination import count_cache
+from utils.presence import presence
+from utils.responses import FastJSONResponse
+from utils.rollup_aggregator import rollup_aggregator
+from utils.security import principal_cache, hash_stats
+from utils.versions import versions
 
 
 @asynccontextmanager
 async def _lifespan(_app: FastAPI):
+    await ensure_default_partition()
+    await ensure_data_indexes()
+    if settings.ROLLUPS_ENABLED:
+        await create_rollup_tables()
+        await rollup_aggregator.start()
+    else:
+        await clear_rollup_coverage()
+    await dimensions.start()
+    await ingest_buffer.start()
+    await mqtt_ingest.start()
+    await presence.start()
+    await command_bus.start()
     await mqtt.mqtt_startup()
+    partition_task = None
+    if settings.PARTITIONING_ENABLED:
+        partition_task = asyncio.create_task(run_maintenance(settings.PARTITION_MAINTENANCE_INTERVAL))
     yield
+    if partition_task is not None:
+        partition_task.cancel()
     await mqtt.mqtt_shutdown()
+    await command_bus.stop()
+    await presence.stop()
+    await mqtt_ingest.stop()
+    await ingest_buffer.stop()
+    await rollup_aggregator.stop()
+    await dimensions.stop()
+
 
+app = FastAPI(lifespan=_lifespan, default_response_class=FastJSONResponse)
 
-app = FastAPI(lifespan=_lifespan)
+app.add_middleware(MetricsMiddleware)
+instrument_engines()
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,18 +77,8 @@ app.include_router(location_api.router)
 app.include_router(device_api.router)
 app.include_router(data_api.router)
 app.include_router(utils_api.router)
+app.include_router(command_api.router)
 
-mqtt_config = MQTTConfig(
-    host="w99564f6.ala.cn-hangzhou.emqxsl.cn",
-    port=8883,
-    ssl=True,
-    username='sensor',
-    password='B2w.N_KaRWp:Nye',
-    reconnect_retries=10,
-    reconnect_delay=5
-)
-
-mqtt = FastMQTT(config=mqtt_config)
 mqtt.init_app(app)
 
 
@@ -52,9 +87,35 @@ async def root():
     return {"message": "Main Application"}
 
 
+registry.register_stats("homeserver_pool", pool_stats, "engine")
+registry.register_stats("homeserver_cache", lambda: {
+    "device": device_cache.stats(),
+    "name": name_cache.stats(),
+    "count": count_cache.stats(),
+    "principal": principal_cache.stats(),
+}, "cache")
+registry.register_stats("homeserver_ingest_buffer", ingest_buffer.stats)
+registry.register_stats("homeserver_rollups", rollup_aggregator.stats)
+registry.register_stats("homeserver_mqtt_ingest", mqtt_ingest.stats)
+registry.register_stats("homeserver_presence", presence.stats)
+registry.register_stats("homeserver_commands", command_bus.stats)
+registry.register_stats("homeserver_live", live_hub.stats)
+registry.register_stats("homeserver_password_hash", hash_stats)
+registry.register_stats("homeserver_conditional", versions.stats)
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @mqtt.on_connect()
 def connect(client, flags, rc, properties):
     mqtt.client.subscribe("/actuators/sg90")
+    for topic in settings.MQTT_SENSOR_TOPICS:
+        mqtt.client.subscribe(topic, qos=settings.MQTT_SENSOR_QOS)
+    for topic in settings.COMMAND_ACK_TOPICS:
+        mqtt.client.subscribe(topic, qos=settings.COMMAND_QOS)
     print("Connected: ", client, flags, rc, properties)
 
 
@@ -65,15 +126,22 @@ def disconnect(client, packet, exc=None):
 
 @mqtt.on_message()
 async def message(client, topic, payload, qos, properties):
+    if mqtt_ingest.submit(topic, payload):
+        MQTT_RECEIVED.inc(("sensor",))
+        return 0
+    if await command_bus.ack_message(topic, payload):
+        MQTT_RECEIVED.inc(("ack",))
+        return 0
+    MQTT_RECEIVED.inc(("other",))
     print("Received message: ", topic, payload.decode(), qos, properties)
     return 0
 
 
+# 兼容旧客户端, 原样发布到固定主题; 新设备使用 /command/send
 @app.post("/actuators/sg90", response_model=Responses)
 async def func(command: Command):
-    if command.command == "open":
-        mqtt.publish("/actuators/sg90", command.command)
-        return Responses(message="open")
-    elif command.command == "close":
-        mqtt.publish("/actuators/sg90", command.command)
-        return Responses(message="close")
+    if command.command not in ("open", "close"):
+        return Responses(status_code=1, message="Unknown command.")
+    mqtt.publish("/actuators/sg90", command.command)
+    MQTT_PUBLISHED.inc()
+    return Responses(message=command.command)
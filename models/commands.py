@@ -0,0 +1,26 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field
+
+
+class DeviceCommand(SQLModel, table=True):
+    __tablename__ = "device_commands"
+    __table_args__ = (
+        Index("ix_device_commands_status_expires_at", "status", "expires_at"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # 命令记录作为历史保留, 不随设备删除
+    device_id: int = Field(index=True)
+    command: str = Field(max_length=32)
+    params: Optional[str] = None
+    topic: str = Field(max_length=255)
+    qos: int = 0
+    # pending / acked / failed / timeout
+    status: str = Field(default="pending", max_length=16)
+    message: Optional[str] = Field(default=None, max_length=255)
+    created_at: datetime
+    expires_at: datetime
+    acked_at: Optional[datetime] = None
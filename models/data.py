@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import TypeVar, Optional
 
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 
 from models.devices import Device
@@ -11,10 +12,17 @@ T = TypeVar("T")
 
 class EnvironmentData(SQLModel, table=True):
     __tablename__ = "environment_data"
+    __table_args__ = (
+        Index("ix_environment_data_timestamp_id", "timestamp", "id"),
+        Index("ix_environment_data_device_timestamp_id", "device_id", "timestamp", "id"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
 
-    id: Optional[int] = Field(primary_key=True)
+    # 复合主键下需显式声明自增
+    id: Optional[int] = Field(primary_key=True, sa_column_kwargs={"autoincrement": True})
     device_id: int = Field(foreign_key="devices.id")
-    timestamp: datetime
+    # 分区键必须包含在主键中
+    timestamp: datetime = Field(primary_key=True)
     temperature: Optional[float]
     humidity: Optional[float]
     illuminance: Optional[int]
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlmodel import SQLModel, Field
+
+
+class EnvironmentDataRollup(SQLModel):
+    device_id: int = Field(primary_key=True, foreign_key="devices.id")
+    bucket: datetime = Field(primary_key=True)
+    location_id: Optional[int] = Field(foreign_key="locations.id")
+    count: int
+    temperature_sum: Optional[float]
+    temperature_min: Optional[float]
+    temperature_max: Optional[float]
+    humidity_sum: Optional[float]
+    humidity_min: Optional[float]
+    humidity_max: Optional[float]
+    illuminance_sum: Optional[float]
+    illuminance_min: Optional[int]
+    illuminance_max: Optional[int]
+
+
+class EnvironmentDataMinute(EnvironmentDataRollup, table=True):
+    __tablename__ = "environment_data_minute"
+
+
+class EnvironmentDataHour(EnvironmentDataRollup, table=True):
+    __tablename__ = "environment_data_hour"
+
+
+class EnvironmentDataDay(EnvironmentDataRollup, table=True):
+    __tablename__ = "environment_data_day"
+
+
+class RollupCoverage(SQLModel, table=True):
+    __tablename__ = "environment_data_rollup_coverage"
+
+    # 汇总表名
+    name: str = Field(primary_key=True, max_length=64)
+    # 不早于该时间的桶数据完整, 更早的区间查询原始数据
+    covered_since: datetime
+
+
+# 由细到粗排列
+ROLLUPS: list[tuple[timedelta, type[EnvironmentDataRollup]]] = [
+    (timedelta(minutes=1), EnvironmentDataMinute),
+    (timedelta(hours=1), EnvironmentDataHour),
+    (timedelta(days=1), EnvironmentDataDay),
+]
@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from db.operations import get_db
+from models.commands import DeviceCommand
+from models.users import User
+from schemas.command_schema import CommandSend, CommandAck, CommandResult
+from schemas.responses_schema import Responses
+from utils.commands import command_bus
+from utils.responses import FastRoute
+from utils.security import get_current_user
+
+router = APIRouter(
+    prefix="/command",
+    tags=["Command"],
+    route_class=FastRoute,
+)
+
+
+@router.post("/send", response_model=Responses[list[CommandResult]])
+async def send(
+        command_send: CommandSend,
+        db: AsyncSession = Depends(get_db),
+        current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        return Responses(status_code=1, message="Not authorized to send command.")
+    if not command_send.device_ids and not command_send.serial_numbers and command_send.location_id is None:
+        return Responses(status_code=1, message="device_ids, serial_numbers or location_id is required.")
+    results = await command_bus.send(db, command_send)
+    if not results:
+        return Responses(status_code=1, message="Device not found.")
+    accepted = sum(result.status_code == 0 for result in results)
+    return Responses[list[CommandResult]](message=f"{accepted}/{len(results)} accepted.", data=results)
+
+
+# 设备通过 MQTT 确认; HTTP 接口仅供管理员手动处理
+@router.post("/ack", response_model=Responses)
+async def ack(
+        command_ack: CommandAck,
+        current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        return Responses(status_code=1, message="Not authorized to ack command.")
+    if not await command_bus.ack(command_ack):
+        return Responses(status_code=1, message="Command not pending.")
+    return Responses()
+
+
+@router.get("/find", response_model=Responses[DeviceCommand])
+async def find(
+        command_id: int,
+        db: AsyncSession = Depends(get_db),
+        current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        return Responses(status_code=1, message="Not authorized to find command.")
+    query = select(DeviceCommand).where(DeviceCommand.id == command_id)
+    command = (await db.scalars(query)).first()
+    if not command:
+        return Responses(status_code=1, message="Command not found.")
+    return Responses(data=command)
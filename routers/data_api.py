@@ -1,50 +1,185 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy import and_, func
+import asyncio
+from datetime import datetime
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query, WebSocket
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, true
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import aliased
 from sqlmodel import select, desc
 
-from db.operations import get_db
+from config import settings
+from db.aggregate import BUCKET_WIDTHS, aggregate_readings, fill_gaps
+from db.ingest import resolve_names
+from db.operations import get_db, get_read_db, get_read_engine
+from db.projections import data_list_query, data_items
 from models.data import EnvironmentData
+from models.devices import Device
 from models.users import User
-from schemas.data_schema import DataList
+from schemas.data_schema import DataList, DataAggregate
 from schemas.pagination_schema import PaginatedResponse, PaginatedRequest
 from schemas.responses_schema import Responses
+from utils.export import MEDIA_TYPES, export_stream, pyarrow
+from utils.latest import latest_readings, reading_item
+from utils.live import live_hub, Subscriber
+from utils.pagination import apply_page, next_cursor, count_total, total_pages
+from utils.responses import FastRoute
 from utils.security import get_current_user
 
 router = APIRouter(
     prefix="/data",
-    tags=["Data"]
+    tags=["Data"],
+    route_class=FastRoute,
 )
 
 
 @router.get("/new", response_model=Responses[DataList])
 async def get_new_data(
         device_id: int | None = None,
-        db: AsyncSession = Depends(get_db)
+        db: AsyncSession = Depends(get_read_db)
 ):
-    # 动态构建过滤条件列表
-    filters = []
-    if device_id is not None:
-        filters.append(EnvironmentData.device_id == device_id)
-        # 获取当前页数据
+    if device_id is None:
+        return Responses(status_code=1, message="device_id is required.")
+    # 优先读取写入路径维护的最新数据缓存
+    reading = latest_readings.get(device_id)
+    if reading is None:
         query_data = (select(EnvironmentData)
-                      .options(selectinload(EnvironmentData.device_name_fk),
-                               selectinload(EnvironmentData.location_name_fk))
-                      .where(and_(*filters))
-                      .order_by(desc(EnvironmentData.timestamp), desc(EnvironmentData.id)))
-        result = await db.execute(query_data)
-        data = result.scalars().first()
-        item = DataList(
-            id=data.id,
-            device_name=data.device_name_fk.name,
-            timestamp=data.timestamp,
-            temperature=data.temperature,
-            humidity=data.humidity,
-            illuminance=data.illuminance,
-            location_name=data.location_name_fk.name,
-        )
-        return Responses(data=item)
+                      .where(EnvironmentData.device_id == device_id)
+                      .order_by(desc(EnvironmentData.timestamp), desc(EnvironmentData.id))
+                      .limit(1))
+        data = (await db.scalars(query_data)).first()
+        if data is None:
+            return Responses(status_code=1, message="Data not found.")
+        reading = data.model_dump(exclude={"id"})
+        latest_readings.update([reading], [data.id])
+        reading = latest_readings.get(device_id)
+    device_names, location_names = await resolve_names(db, [device_id], [reading["location_id"]])
+    item = reading_item(reading, device_names.get(device_id), location_names.get(reading["location_id"]))
+    return Responses[DataList](data=item)
+
+
+@router.get("/latest", response_model=Responses[list[DataList]])
+async def get_latest_data(
+        device_ids: list[int] = Query(default=[]),
+        location_id: int | None = None,
+        db: AsyncSession = Depends(get_read_db)
+):
+    if not device_ids and location_id is None:
+        return Responses(status_code=1, message="device_ids or location_id is required.")
+    ids = set(device_ids)
+    if location_id is not None:
+        result = await db.execute(select(Device.id).where(Device.location_id == location_id))
+        ids.update(result.scalars())
+    # 缓存未命中的设备用 LATERAL 一次查询补齐, 每个设备沿 (device_id, timestamp, id) 索引反向只读一条
+    missing = [device_id for device_id in ids if latest_readings.get(device_id) is None]
+    if missing:
+        devices = select(Device.id).where(Device.id.in_(missing)).subquery("devices")
+        latest = (select(EnvironmentData)
+                  .where(EnvironmentData.device_id == devices.c.id)
+                  .order_by(desc(EnvironmentData.timestamp), desc(EnvironmentData.id))
+                  .limit(1)
+                  .lateral("latest"))
+        query_data = select(aliased(EnvironmentData, latest)).select_from(devices).join(latest, true())
+        datas = (await db.scalars(query_data)).all()
+        latest_readings.update([data.model_dump(exclude={"id"}) for data in datas], [data.id for data in datas])
+    readings = [reading for reading in map(latest_readings.get, sorted(ids)) if reading is not None]
+    device_names, location_names = await resolve_names(
+        db,
+        (reading["device_id"] for reading in readings),
+        (reading["location_id"] for reading in readings),
+    )
+    items = [
+        reading_item(reading, device_names.get(reading["device_id"]), location_names.get(reading["location_id"]))
+        for reading in readings
+    ]
+    return Responses[list[DataList]](data=items)
+
+
+async def _subscribe(device_ids: list[int], location_id: int | None) -> Subscriber | None:
+    subscriber = live_hub.subscribe(device_ids, location_id)
+    if subscriber is None:
+        return None
+    # 订阅时预热设备名称, 推送时不再查询数据库
+    try:
+        async with AsyncSession(await get_read_engine(), expire_on_commit=False) as db:
+            ids = set(device_ids)
+            if location_id is not None:
+                result = await db.execute(select(Device.id).where(Device.location_id == location_id))
+                ids.update(result.scalars())
+            device_names, _ = await resolve_names(db, ids, [location_id])
+    except Exception:
+        live_hub.unsubscribe(subscriber)
+        raise
+    live_hub.remember_names(device_names)
+    return subscriber
+
+
+@router.websocket("/ws")
+async def data_ws(
+        websocket: WebSocket,
+        device_ids: list[int] = Query(default=[]),
+        location_id: int | None = None,
+):
+    if not device_ids and location_id is None:
+        await websocket.close(code=1008, reason="device_ids or location_id is required.")
+        return
+    subscriber = await _subscribe(device_ids, location_id)
+    if subscriber is None:
+        await websocket.close(code=1013, reason="Too many subscribers.")
+        return
+    await websocket.accept()
+    # 客户端只接收数据, 读取任务用于及时发现断开
+    receiver = asyncio.create_task(websocket.receive())
+    try:
+        while True:
+            getter = asyncio.create_task(subscriber.get())
+            await asyncio.wait((getter, receiver), return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                if receiver.result()["type"] == "websocket.disconnect":
+                    break
+                receiver = asyncio.create_task(websocket.receive())
+                continue
+            for frame in getter.result():
+                await websocket.send_text(frame)
+    except Exception:
+        # 发送时连接已断开
+        pass
+    finally:
+        receiver.cancel()
+        live_hub.unsubscribe(subscriber)
+
+
+@router.get("/subscribe")
+async def data_subscribe(
+        device_ids: list[int] = Query(default=[]),
+        location_id: int | None = None,
+):
+    if not device_ids and location_id is None:
+        return Responses(status_code=1, message="device_ids or location_id is required.")
+    subscriber = await _subscribe(device_ids, location_id)
+    if subscriber is None:
+        return Responses(status_code=1, message="Too many subscribers.")
+
+    async def events():
+        try:
+            while True:
+                try:
+                    frames = await asyncio.wait_for(subscriber.get(), settings.LIVE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # 注释行保活, 避免代理断开空闲连接
+                    yield ": keepalive\n\n"
+                    continue
+                yield "".join(f"data: {frame}\n\n" for frame in frames)
+        finally:
+            live_hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.delete("/delete", response_model=Responses)
@@ -61,6 +196,9 @@ async def delete(
         return Responses(status_code=1, message="Data not found.")
     await db.delete(data)
     await db.commit()
+    reading = latest_readings.get(data.device_id)
+    if reading is not None and reading["id"] == data.id:
+        latest_readings.pop(data.device_id)
     return Responses(message="Data deleted.")
 
 
@@ -68,52 +206,104 @@ async def delete(
 async def data_list(
         device_id: int | None = None,
         location_id: int | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
         pagination: PaginatedRequest = Depends(PaginatedRequest),
-        db: AsyncSession = Depends(get_db)
+        db: AsyncSession = Depends(get_read_db)
 ):
     # 分页数据
     page = pagination.page
     size = pagination.size
-    offset = (page - 1) * size
     # 动态构建过滤条件列表
     filters = []
     if location_id is not None:
         filters.append(EnvironmentData.location_id == location_id)
     if device_id is not None:
         filters.append(EnvironmentData.device_id == device_id)
+    # 时间范围条件可触发分区裁剪
+    if start is not None:
+        filters.append(EnvironmentData.timestamp >= start)
+    if end is not None:
+        filters.append(EnvironmentData.timestamp < end)
     # 获取当前页数据
-    query_data = (select(EnvironmentData)
-                  .options(selectinload(EnvironmentData.device_name_fk), selectinload(EnvironmentData.location_name_fk))
-                  .where(and_(*filters))
-                  .order_by(desc(EnvironmentData.timestamp),desc(EnvironmentData.id))
-                  .offset(offset).limit(size))
+    query_data = data_list_query(filters)
+    try:
+        query_data = apply_page(query_data, pagination, EnvironmentData.timestamp, EnvironmentData.id,
+                                descending=True)
+    except ValueError:
+        return Responses(status_code=1, message="Invalid cursor.")
     result = await db.execute(query_data)
-    datas = result.scalars().all()
-    items: list[DataList] = []
-    for data in datas:
-        item = DataList(
-            id=data.id,
-            device_name=data.device_name_fk.name,
-            timestamp=data.timestamp,
-            temperature=data.temperature,
-            humidity=data.humidity,
-            illuminance=data.illuminance,
-            location_name=data.location_name_fk.name,
-        )
-        items.append(item)
+    items = await data_items(result.all())
     # 获取总记录数
-    query_total = (select(func.count())
-               .select_from(EnvironmentData)
-               .where(and_(*filters)))
-    count = await db.execute(query_total)
-    total = count.scalar_one()
-    # 计算总页数
-    total_pages = (total + size - 1) // size
+    total, total_exact = await count_total(db, EnvironmentData, filters, pagination.count)
     paginated_response = PaginatedResponse[DataList](
         items=items,
         page=page,
         size=size,
         total=total,
-        total_pages=total_pages
+        total_pages=total_pages(total, size),
+        total_exact=total_exact,
+        next_cursor=next_cursor(items, size, "timestamp", "id"),
+    )
+    return Responses[PaginatedResponse[DataList]](data=paginated_response)
+
+
+@router.get("/aggregate", response_model=Responses[list[DataAggregate]])
+async def data_aggregate(
+        start: datetime,
+        end: datetime,
+        bucket: Literal["1m", "5m", "1h", "1d"] = "1h",
+        device_id: int | None = None,
+        location_id: int | None = None,
+        fill: bool = False,
+        db: AsyncSession = Depends(get_read_db)
+):
+    if device_id is None and location_id is None:
+        return Responses(status_code=1, message="device_id or location_id is required.")
+    if end <= start:
+        return Responses(status_code=1, message="Invalid time range.")
+    width = BUCKET_WIDTHS[bucket]
+    if (end - start) / width > settings.AGGREGATE_MAX_BUCKETS:
+        return Responses(status_code=1, message="Too many buckets.")
+    items = await aggregate_readings(db, device_id, location_id, start, end, width)
+    if fill:
+        items = fill_gaps(items, start, end, width)
+    return Responses[list[DataAggregate]](data=items)
+
+
+@router.get("/export")
+async def data_export(
+        start: datetime | None = None,
+        end: datetime | None = None,
+        device_id: int | None = None,
+        location_id: int | None = None,
+        export_format: Literal["csv", "ndjson", "arrow"] = Query(default="csv", alias="format"),
+        compress: bool = Query(default=False, alias="gzip"),
+):
+    if export_format == "arrow" and pyarrow is None:
+        return Responses(status_code=1, message="Arrow export requires pyarrow.")
+    # 动态构建过滤条件列表
+    filters = []
+    if start is not None:
+        filters.append(EnvironmentData.timestamp >= start)
+    if end is not None:
+        filters.append(EnvironmentData.timestamp < end)
+    if location_id is not None:
+        filters.append(EnvironmentData.location_id == location_id)
+    if device_id is not None:
+        filters.append(EnvironmentData.device_id == device_id)
+    query_data = (select(EnvironmentData.id, EnvironmentData.device_id, EnvironmentData.timestamp,
+                         EnvironmentData.temperature, EnvironmentData.humidity, EnvironmentData.illuminance,
+                         EnvironmentData.location_id)
+                  .where(and_(*filters))
+                  .order_by(EnvironmentData.timestamp, EnvironmentData.id))
+    filename = f"environment_data.{export_format}"
+    media_type = MEDIA_TYPES[export_format]
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        export_stream(query_data, export_format, compress, settings.EXPORT_CHUNK_ROWS, await get_read_engine()),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
-    return Responses(data=paginated_response)
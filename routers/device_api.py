@@ -1,24 +1,32 @@
 from datetime import datetime
 
-from fastapi import APIRouter, Depends
-from sqlalchemy import and_, func
+from fastapi import APIRouter, Depends, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload, selectinload
 from sqlmodel import select
 
-from db.operations import get_db
-from models.data import EnvironmentData
+from config import settings
+from db.ingest import resolve_devices, build_reading, insert_readings, upload_error, device_cache, name_cache
+from db.operations import get_db, get_read_db
+from db.projections import device_list_query, device_items, device_status_items
 from models.devices import Device
 from models.users import User
 from schemas.device_schema import DeviceAdd, DeviceUpdate, LTHData, DeviceUpload, DeviceStatusUpdate, DeviceSearch, \
-    DeviceList, DeviceStatusList
+    DeviceList, DeviceStatusList, DeviceUploadResult
 from schemas.pagination_schema import PaginatedResponse, PaginatedRequest
 from schemas.responses_schema import Responses
+from utils.ingest_buffer import ingest_buffer
+from utils.latest import latest_readings
+from utils.live import live_hub
+from utils.pagination import apply_page, next_cursor, count_total, total_pages
+from utils.presence import presence
+from utils.responses import FastRoute
 from utils.security import get_current_user
+from utils.versions import versions, not_modified
 
 router = APIRouter(
     prefix="/device",
-    tags=["Device"]
+    tags=["Device"],
+    route_class=FastRoute,
 )
 
 
@@ -27,16 +35,13 @@ async def status(
         update_status: DeviceStatusUpdate,
         db: AsyncSession = Depends(get_db)
 ):
-    query = select(Device).where(Device.serial_number == update_status.serial_number)
-    device = (await db.scalars(query)).first()
+    devices = await resolve_devices(db, [update_status.serial_number])
+    device = devices.get(update_status.serial_number)
     if not device:
         return Responses(status_code=1, message="Device not found.")
-    device.firmware_version = update_status.firmware_version
-    device.last_online = datetime.now()
-    device.is_online = update_status.is_online
-    db.add(device)
-    await db.commit()
-    await db.refresh(device)
+    device_id, _ = device
+    # 心跳只记录在内存中, 由后台任务批量写入
+    presence.heartbeat(device_id, update_status.firmware_version, update_status.is_online)
     return Responses()
 
 
@@ -45,21 +50,61 @@ async def upload(
         upload_data: DeviceUpload[LTHData],
         db: AsyncSession = Depends(get_db)
 ):
-    query = select(Device).where(Device.serial_number == upload_data.serial_number)
-    device = (await db.scalars(query)).first()
-    envir_data = EnvironmentData(
-        device_id=device.id,
-        timestamp=upload_data.timestamp,
-        temperature=upload_data.message.temp,
-        humidity=upload_data.message.humi,
-        illuminance=upload_data.message.lux,
-        location_id=device.location_id,
-    )
-    db.add(envir_data)
-    await db.commit()
+    devices = await resolve_devices(db, [upload_data.serial_number])
+    device = devices.get(upload_data.serial_number)
+    if not device:
+        return Responses(status_code=1, message="Device not found.")
+    error = upload_error(upload_data)
+    if error is not None:
+        return Responses(status_code=1, message=error)
+    row = build_reading(upload_data, *device)
+    if not settings.INGEST_BUFFER_ENABLED:
+        await insert_readings(db, [row])
+        return Responses()
+    # 写入缓冲区, 由后台任务批量提交; 积压超过上限时拒绝, 由设备稍后重试
+    if ingest_buffer.full():
+        return Responses(status_code=1, message="Ingest buffer full.")
+    waiter = ingest_buffer.put(row, wait=settings.INGEST_DURABILITY == "flush")
+    if waiter is not None:
+        try:
+            await waiter
+        except Exception:
+            return Responses(status_code=1, message="Upload failed.")
     return Responses()
 
 
+@router.post('/upload/batch', response_model=Responses[list[DeviceUploadResult]])
+async def upload_batch(
+        upload_datas: list[DeviceUpload[LTHData]],
+        db: AsyncSession = Depends(get_db)
+):
+    # 一次查询解析全部设备
+    devices = await resolve_devices(db, (upload_data.serial_number for upload_data in upload_datas))
+    results: list[DeviceUploadResult] = []
+    rows: list[dict] = []
+    accepted: list[DeviceUploadResult] = []
+    for upload_data in upload_datas:
+        result = DeviceUploadResult(serial_number=upload_data.serial_number)
+        results.append(result)
+        device = devices.get(upload_data.serial_number)
+        if device is None:
+            result.status_code = 1
+            result.message = "Device not found."
+            continue
+        error = upload_error(upload_data)
+        if error is not None:
+            result.status_code = 1
+            result.message = error
+            continue
+        rows.append(build_reading(upload_data, *device))
+        accepted.append(result)
+    # 多行插入, 单事务提交
+    ids = await insert_readings(db, rows)
+    for result, data_id in zip(accepted, ids):
+        result.id = data_id
+    return Responses[list[DeviceUploadResult]](message=f"{len(rows)}/{len(upload_datas)} accepted.", data=results)
+
+
 @router.post("/add", response_model=Responses)
 async def add(
         device_add: DeviceAdd,
@@ -77,6 +122,8 @@ async def add(
     )
     db.add(device)
     await db.commit()
+    device_cache.pop(device.serial_number)
+    versions.bump("devices")
     return Responses(message="Device added.")
 
 
@@ -94,6 +141,12 @@ async def delete(
         return Responses(status_code=1, message="Device not found.")
     await db.delete(device)
     await db.commit()
+    device_cache.pop(device.serial_number)
+    name_cache.pop(device.id)
+    latest_readings.pop(device.id)
+    live_hub.forget_name(device.id)
+    presence.forget(device.id)
+    versions.bump("devices")
     return Responses(message="Device deleted.")
 
 
@@ -129,20 +182,29 @@ async def update(
     db.add(device)
     await db.commit()
     await db.refresh(device)
+    device_cache.pop(device.serial_number)
+    name_cache.pop(device.id)
+    live_hub.remember_names({device.id: device.name})
+    versions.bump("devices")
     return Responses(message="Device updated.")
 
 
 @router.get("/list", response_model=Responses[PaginatedResponse[DeviceList]])
 async def devices_list(
+        request: Request,
+        response: Response,
         location_id: int | None = None,
         device_search: DeviceSearch = Depends(DeviceSearch),
         pagination: PaginatedRequest = Depends(PaginatedRequest),
-        db: AsyncSession = Depends(get_db),
+        db: AsyncSession = Depends(get_read_db),
 ):
+    # 数据未变化时直接返回 304, 不执行分页与计数查询
+    cached = not_modified(request, response, "devices", "locations", "device_types", replica=True)
+    if cached is not None:
+        return cached
     # 分页数据
     page = pagination.page
     size = pagination.size
-    offset = (page - 1) * size
     # 动态构建过滤条件列表
     filters = []
     if device_search.type_id is not None:
@@ -154,95 +216,56 @@ async def devices_list(
     if device_search.is_online is not None:
         filters.append(Device.is_online == device_search.is_online)
     # 获取当前页数据
-    query_device = (select(Device)
-                    .options(selectinload(Device.device_type),selectinload(Device.location))
-                    .where(and_(*filters))
-                    .offset(offset).limit(size))
+    query_device = device_list_query(filters)
+    try:
+        query_device = apply_page(query_device, pagination, Device.id)
+    except ValueError:
+        return Responses(status_code=1, message="Invalid cursor.")
     result = await db.execute(query_device)
-    devices = result.scalars().all()
-    items: list[DeviceList] = []
-    for device in devices:
-        item = DeviceList(
-            id=device.id,
-            name=device.name,
-            type_name=device.device_type.name,
-            location_name=device.location.name,
-            mac_address=device.mac_address,
-            serial_number=device.serial_number,
-            firmware_version=device.firmware_version,
-            created_at=device.created_at,
-            is_online=device.is_online,
-            last_online=device.last_online,
-        )
-        items.append(item)
+    items = await device_items(result.all())
     # 获取总记录数
-    query_total = (select(func.count())
-                   .select_from(Device)
-                   .where(and_(*filters)))
-    count = await db.execute(query_total)
-    total = count.scalar_one()
-    # 计算总页数
-    total_pages = (total + size - 1) // size
+    total, total_exact = await count_total(db, Device, filters, pagination.count)
     paginated_response = PaginatedResponse[DeviceList](
         items=items,
         page=page,
         size=size,
         total=total,
-        total_pages=total_pages
+        total_pages=total_pages(total, size),
+        total_exact=total_exact,
+        next_cursor=next_cursor(items, size, "id"),
     )
-    return Responses(data=paginated_response)
+    return Responses[PaginatedResponse[DeviceList]](data=paginated_response)
 
 @router.get("/status", response_model=Responses[PaginatedResponse[DeviceStatusList]])
 async def devices_status_list(
         location_id: int,
         pagination: PaginatedRequest = Depends(PaginatedRequest),
-        db: AsyncSession = Depends(get_db),
+        db: AsyncSession = Depends(get_read_db),
 ):
     # 分页数据
     page = pagination.page
     size = pagination.size
-    offset = (page - 1) * size
     # 动态构建过滤条件列表
     filters = []
     if location_id is not None:
         filters.append(Device.location_id == location_id)
     # 获取当前页数据
-    query_device = (select(Device)
-                    .options(selectinload(Device.device_type),selectinload(Device.location))
-                    .where(and_(*filters))
-                    .offset(offset).limit(size))
+    query_device = device_list_query(filters)
+    try:
+        query_device = apply_page(query_device, pagination, Device.id)
+    except ValueError:
+        return Responses(status_code=1, message="Invalid cursor.")
     result = await db.execute(query_device)
-    devices = result.scalars().all()
-    items: list[DeviceStatusList] = []
-    for device in devices:
-        item = DeviceStatusList(
-            id=device.id,
-            name=device.name,
-            type_name=device.device_type.name,
-            location_name=device.location.name,
-            mac_address=device.mac_address,
-            serial_number=device.serial_number,
-            firmware_version=device.firmware_version,
-            created_at=device.created_at,
-            is_online=device.is_online,
-            last_online=device.last_online,
-            status=device.status,
-            operation=device.device_type.capitalize,
-        )
-        items.append(item)
+    items = await device_status_items(result.all())
     # 获取总记录数
-    query_total = (select(func.count())
-                   .select_from(Device)
-                   .where(and_(*filters)))
-    count = await db.execute(query_total)
-    total = count.scalar_one()
-    # 计算总页数
-    total_pages = (total + size - 1) // size
+    total, total_exact = await count_total(db, Device, filters, pagination.count)
     paginated_response = PaginatedResponse[DeviceStatusList](
         items=items,
         page=page,
         size=size,
         total=total,
-        total_pages=total_pages
+        total_pages=total_pages(total, size),
+        total_exact=total_exact,
+        next_cursor=next_cursor(items, size, "id"),
     )
-    return Responses(data=paginated_response)
+    return Responses[PaginatedResponse[DeviceStatusList]](data=paginated_response)
@@ -1,44 +1,41 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy import func
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlmodel import select
+from fastapi import APIRouter, Depends, Request, Response
 
-from db.operations import get_db
 from models.locations import Location
 from schemas.pagination_schema import PaginatedRequest, PaginatedResponse
 from schemas.responses_schema import Responses
+from utils.dimensions import dimensions
+from utils.pagination import total_pages
+from utils.responses import FastRoute
+from utils.versions import not_modified
 
 router = APIRouter(
     prefix="/location",
-    tags=["Location"]
+    tags=["Location"],
+    route_class=FastRoute,
 )
 
 @router.get("/list", response_model=Responses[PaginatedResponse[Location]])
 async def locations_list(
+    request: Request,
+    response: Response,
     pagination: PaginatedRequest = Depends(PaginatedRequest),
-    db: AsyncSession = Depends(get_db)
 ):
+    # 数据未变化时直接返回 304
+    cached = not_modified(request, response, "locations")
+    if cached is not None:
+        return cached
     # 分页数据
     page = pagination.page
     size = pagination.size
     offset = (page - 1) * size
-    # 获取当前页数据
-    query_location = (select(Location)
-                  .offset(offset).limit(size))
-    result = await db.execute(query_location)
-    locations = result.scalars().all()
-    # 获取总记录数
-    query_total = (select(func.count())
-                   .select_from(Location))
-    count = await db.execute(query_total)
-    total = count.scalar_one()
-    # 计算总页数
-    total_pages = (total + size - 1) // size
+    # 位置数据直接由维表缓存提供
+    locations = list(dimensions.locations.values())
+    total = len(locations)
     paginated_response = PaginatedResponse[Location](
-        items=locations,
+        items=locations[offset:offset + size],
         page=page,
         size=size,
         total=total,
-        total_pages=total_pages
+        total_pages=total_pages(total, size),
     )
-    return Responses(data=paginated_response)
\ No newline at end of file
+    return Responses[PaginatedResponse[Location]](data=paginated_response)
@@ -1,8 +1,8 @@
 from datetime import datetime, timedelta
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from fastapi.params import Query
-from sqlalchemy import and_, func
+from sqlalchemy import and_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
 
@@ -13,11 +13,16 @@ from schemas.pagination_schema import PaginatedResponse, PaginatedRequest
 from schemas.responses_schema import Responses, Token
 from schemas.user_schema import UserRegister, UserLogin, UserAdd, UserInfo, UserPasswordUpdate, UserUpdate, UserSearch, \
     UserList
-from utils.security import get_password_hash, verify_password, create_access_token, get_current_user
+from utils.pagination import apply_page, next_cursor, count_total, total_pages
+from utils.responses import FastRoute
+from utils.security import get_password_hash, verify_password, create_access_token, get_current_user, \
+    invalidate_user, password_needs_rehash
+from utils.versions import versions, not_modified
 
 router = APIRouter(
     prefix="/user",
-    tags=["User"]
+    tags=["User"],
+    route_class=FastRoute,
 )
 
 
@@ -27,7 +32,7 @@ async def register(user_create: UserRegister, db: AsyncSession = Depends(get_db)
     existing_user = (await db.scalars(query)).first()
     if existing_user:
         return Responses(status_code=1, message="Username already registered.")
-    hashed_password = get_password_hash(user_create.password)
+    hashed_password = await get_password_hash(user_create.password)
     db_user = User(
         username=user_create.username,
         password_hash=hashed_password,
@@ -37,6 +42,7 @@ async def register(user_create: UserRegister, db: AsyncSession = Depends(get_db)
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    versions.bump("users")
     return Responses(message="User registered.")
 
 
@@ -44,8 +50,11 @@ async def register(user_create: UserRegister, db: AsyncSession = Depends(get_db)
 async def login(user_login: UserLogin, db: AsyncSession = Depends(get_db)):
     query = select(User).where(User.username == user_login.username)
     user = (await db.scalars(query)).first()
-    if not user or not verify_password(user_login.password, user.password_hash):
+    if not user or not await verify_password(user_login.password, user.password_hash):
         return Responses(status_code=1, message="Incorrect username or password.")
+    # 成本因子变更后登录时透明地重新哈希
+    if password_needs_rehash(user.password_hash):
+        user.password_hash = await get_password_hash(user_login.password)
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
@@ -58,22 +67,16 @@ async def login(user_login: UserLogin, db: AsyncSession = Depends(get_db)):
     db.add(user)
     await db.commit()
     await db.refresh(user)
+    invalidate_user(user.username)
+    versions.bump("users")
     return Responses(message="Login successful.", data=token)
 
 
 @router.get("/info", response_model=Responses[UserInfo])
 async def get_info(
-        db: AsyncSession = Depends(get_db),
         current_user: User = Depends(get_current_user)
 ):
-    query = select(User).where(User.username == current_user.username)
-    user = (await db.scalars(query)).first()
-    if not user:
-        return Responses(status_code=1, message="User not found.")
-    db.add(user)
-    await db.commit()
-    await db.refresh(user)
-    return Responses(data=user)
+    return Responses(data=current_user)
 
 
 @router.patch("/update_info", response_model=Responses)
@@ -96,6 +99,8 @@ async def update_info(
     db.add(user)
     await db.commit()
     await db.refresh(user)
+    invalidate_user(current_user.username, user.username)
+    versions.bump("users")
     return Responses(message="User updated.")
 
 
@@ -105,16 +110,18 @@ async def update_password(
         db: AsyncSession = Depends(get_db),
         current_user: User = Depends(get_current_user)
 ):
-    if not verify_password(passwd_update.password, current_user.password_hash):
+    if not await verify_password(passwd_update.password, current_user.password_hash):
         return Responses(status_code=1, message="Password error.")
     if passwd_update.new_password != passwd_update.re_password:
         return Responses(status_code=1, message="RePassword error.")
     query = select(User).where(User.id == current_user.id)
     user = (await db.scalars(query)).first()
-    user.password_hash = get_password_hash(passwd_update.new_password)
+    user.password_hash = await get_password_hash(passwd_update.new_password)
     db.add(user)
     await db.commit()
     await db.refresh(user)
+    invalidate_user(user.username)
+    versions.bump("users")
     return Responses(message="Password updated.")
 
 
@@ -135,12 +142,13 @@ async def add(
         if key != 'password':
             setattr(user, key, value)
         elif key == 'password':
-            setattr(user, 'password_hash', get_password_hash(value))
+            setattr(user, 'password_hash', await get_password_hash(value))
     user.created_at = datetime.now()
     user.updated_at = datetime.now()
     db.add(user)
     await db.commit()
     await db.refresh(user)
+    versions.bump("users")
     return Responses(message="User updated.")
 
 
@@ -158,6 +166,8 @@ async def delete(
         return Responses(status_code=1, message="User not found.")
     await db.delete(user)
     await db.commit()
+    invalidate_user(user.username)
+    versions.bump("users")
     return Responses(message="User deleted.")
 
 
@@ -188,6 +198,7 @@ async def update(
     user = (await db.scalars(query)).first()
     if not user:
         return Responses(status_code=1, message="User not found.")
+    username = user.username
     user.username = user_update.username
     user.email = user_update.email
     user.phone = user_update.phone
@@ -195,11 +206,15 @@ async def update(
     user.updated_at = datetime.now()
     db.add(user)
     await db.commit()
+    invalidate_user(username, user.username)
+    versions.bump("users")
     return Responses(message="User updated.")
 
 
 @router.get("/list", response_model=Responses[PaginatedResponse[UserList]])
 async def users_list(
+        request: Request,
+        response: Response,
         user_search: UserSearch = Depends(UserSearch),
         pagination: PaginatedRequest = Depends(PaginatedRequest),
         db: AsyncSession = Depends(get_db),
@@ -207,10 +222,13 @@ async def users_list(
 ):
     if current_user.role != "admin":
         return Responses(status_code=1, message="Permission denied.")
+    # 数据未变化时直接返回 304, 不执行分页与计数查询
+    cached = not_modified(request, response, "users")
+    if cached is not None:
+        return cached
     # 分页数据
     page = pagination.page
     size = pagination.size
-    offset = (page - 1) * size
     # 动态构建过滤条件列表
     filters = []
     if user_search.username is not None:
@@ -219,8 +237,11 @@ async def users_list(
         filters.append(User.role == user_search.role)
     # 获取当前页数据
     query_user = (select(User)
-               .where(and_(*filters))
-               .offset(offset).limit(size))
+               .where(and_(*filters)))
+    try:
+        query_user = apply_page(query_user, pagination, User.id)
+    except ValueError:
+        return Responses(status_code=1, message="Invalid cursor.")
     result = await db.execute(query_user)
     users = result.scalars().all()
     items: list[UserList] = []
@@ -237,18 +258,14 @@ async def users_list(
         )
         items.append(item)
     # 获取总记录数
-    query_total = (select(func.count())
-               .select_from(User)
-               .where(and_(*filters)))
-    count = await db.execute(query_total)
-    total = count.scalar_one()
-    # 计算总页数
-    total_pages = (total + size - 1) // size
+    total, total_exact = await count_total(db, User, filters, pagination.count)
     paginated_response = PaginatedResponse[UserList](
         items=items,
         page=page,
         size=size,
         total=total,
-        total_pages=total_pages
+        total_pages=total_pages(total, size),
+        total_exact=total_exact,
+        next_cursor=next_cursor(users, size, "id"),
     )
-    return Responses(data=paginated_response)
+    return Responses[PaginatedResponse[UserList]](data=paginated_response)
@@ -7,14 +7,26 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
 
 from config import settings
-from db.operations import get_db
+from db.ingest import device_cache, name_cache
+from db.operations import get_db, pool_stats, replica_health
 from models.users import User
-from schemas.responses_schema import Token
-from utils.security import create_access_token
+from schemas.responses_schema import Token, Responses
+from utils.dimensions import dimensions
+from utils.ingest_buffer import ingest_buffer
+from utils.latest import latest_readings
+from utils.live import live_hub
+from utils.mqtt_ingest import mqtt_ingest
+from utils.pagination import count_cache
+from utils.presence import presence
+from utils.responses import FastRoute
+from utils.rollup_aggregator import rollup_aggregator
+from utils.security import create_access_token, principal_cache, hash_stats
+from utils.versions import versions
 
 router = APIRouter(
     prefix="/utils",
-    tags=["Utils"]
+    tags=["Utils"],
+    route_class=FastRoute,
 )
 
 
@@ -36,3 +48,40 @@ async def get_token(
         data={"sub": user.username}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
+
+
+@router.get("/cache", response_model=Responses[dict])
+async def cache_stats():
+    return Responses(data={
+        "device": device_cache.stats(),
+        "name": name_cache.stats(),
+        "latest": latest_readings.stats(),
+        "dimensions": dimensions.stats(),
+        "principal": principal_cache.stats(),
+        "count": count_cache.stats(),
+        "conditional": versions.stats(),
+    })
+
+
+@router.get("/ingest", response_model=Responses[dict])
+async def ingest_stats():
+    return Responses(data={
+        "buffer": ingest_buffer.stats(),
+        "mqtt": mqtt_ingest.stats(),
+        "presence": presence.stats(),
+        "rollups": rollup_aggregator.stats(),
+        "live": live_hub.stats(),
+    })
+
+
+@router.get("/hash", response_model=Responses[dict])
+async def password_hash_stats():
+    return Responses(data=hash_stats())
+
+
+@router.get("/pool", response_model=Responses[dict])
+async def db_pool_stats():
+    return Responses(data={
+        "pools": pool_stats(),
+        "replica": replica_health,
+    })
@@ -0,0 +1,31 @@
+from typing import Optional, Literal, Any
+
+from pydantic import BaseModel
+from sqlmodel import Field
+
+
+class CommandSend(BaseModel):
+    command: str
+    params: Optional[dict[str, Any]] = None
+    # 按设备 id / 序列号 / 位置寻址, 三者取并集
+    device_ids: list[int] = []
+    serial_numbers: list[str] = []
+    location_id: Optional[int] = None
+    qos: Optional[Literal[0, 1, 2]] = None
+    # 等待设备确认或超时后再返回
+    wait: bool = False
+
+
+class CommandAck(BaseModel):
+    id: int
+    status: Literal["ok", "error"] = "ok"
+    message: Optional[str] = Field(default=None, max_length=255)
+
+
+class CommandResult(BaseModel):
+    device_id: int
+    serial_number: str
+    command_id: Optional[int] = None
+    status: str
+    status_code: int = 0
+    message: Optional[str] = None
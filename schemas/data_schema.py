@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Optional
 
 from pydantic import BaseModel, ConfigDict
 
@@ -15,5 +16,27 @@ class DataList(BaseModel):
     illuminance: int
     location_name: str
 
+
+class LiveReading(DataList):
+    device_id: int
+    location_id: Optional[int] = None
+    # 推送时名称只取自缓存, 未命中时为空
+    device_name: Optional[str] = None
+    location_name: Optional[str] = None
+
+class MetricStats(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+    avg: Optional[float] = None
+
+
+class DataAggregate(BaseModel):
+    bucket: datetime
+    count: int
+    temperature: MetricStats
+    humidity: MetricStats
+    illuminance: MetricStats
+
+
 class Command(BaseModel):
     command: str
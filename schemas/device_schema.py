@@ -21,6 +21,13 @@ class LTHData(BaseModel):
     humi: float
 
 
+class DeviceUploadResult(BaseModel):
+    serial_number: str
+    status_code: int = 0
+    message: Optional[str] = None
+    id: Optional[int] = None
+
+
 class DeviceAdd(BaseModel):
     name: str = Field(max_length=32)
     type_id: int
@@ -1,4 +1,4 @@
-from typing import TypeVar, Generic, List
+from typing import TypeVar, Generic, List, Optional, Literal
 
 from pydantic import BaseModel
 
@@ -6,13 +6,19 @@ T = TypeVar("T")
 
 
 class PaginatedRequest(BaseModel):
-    page: int
+    page: int = 1
     size: int
+    # keyset 分页游标, 取上一页响应中的 next_cursor
+    after: Optional[str] = None
+    # 总数统计方式: exact 精确(短期缓存), estimated 取规划器估计值, none 不统计
+    count: Literal["exact", "estimated", "none"] = "exact"
 
 
 class PaginatedResponse(BaseModel, Generic[T]):
     items: List[T]
     page: int
     size: int
-    total: int
-    total_pages: int
+    total: Optional[int]
+    total_pages: Optional[int]
+    total_exact: bool = True
+    next_cursor: Optional[str] = None
@@ -0,0 +1,263 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from pydantic import ValidationError
+from sqlalchemy import insert, update, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import SQLModel, select
+
+from config import settings
+from db.ingest import resolve_devices
+from db.operations import async_engine
+from models.commands import DeviceCommand
+from models.devices import Device
+from schemas.command_schema import CommandSend, CommandAck, CommandResult
+from utils.dimensions import dimensions
+from utils.metrics import MQTT_PUBLISHED
+from utils.mqtt import mqtt
+from utils.mqtt_ingest import match_topic
+
+
+def parse_capabilities(capabilities: str | None) -> set[str]:
+    # 支持 JSON 数组与逗号分隔两种写法
+    if not capabilities:
+        return set()
+    capabilities = capabilities.strip()
+    if capabilities.startswith("["):
+        try:
+            return {str(item).strip() for item in json.loads(capabilities)}
+        except ValueError:
+            return set()
+    return {item.strip() for item in capabilities.split(",") if item.strip()}
+
+
+class CommandBus:
+    def __init__(self, topic_template: str, ack_topics: list[str], qos: int, ack_timeout: float,
+                 sweep_interval: float):
+        self.topic_template = topic_template
+        self.ack_topics = ack_topics
+        self.qos = qos
+        self.ack_timeout = ack_timeout
+        self.sweep_interval = sweep_interval
+        # command_id -> 等待确认的请求
+        self._waiters: dict[int, asyncio.Future] = {}
+        self._task: asyncio.Task | None = None
+        self.sent = 0
+        self.rejected = 0
+        self.publish_failed = 0
+        self.acked = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    def topic(self, type_name: str, serial_number: str) -> str:
+        return self.topic_template.format(type=type_name, serial_number=serial_number)
+
+    async def send(self, db: AsyncSession, command_send: CommandSend) -> list[CommandResult]:
+        # 一次查询解析全部目标设备
+        conditions = []
+        if command_send.device_ids:
+            conditions.append(Device.id.in_(command_send.device_ids))
+        if command_send.serial_numbers:
+            conditions.append(Device.serial_number.in_(command_send.serial_numbers))
+        if command_send.location_id is not None:
+            conditions.append(Device.location_id == command_send.location_id)
+        if not conditions:
+            return []
+        query = (select(Device.id, Device.serial_number, Device.type_id)
+                 .where(or_(*conditions))
+                 .order_by(Device.id))
+        devices = (await db.execute(query)).all()
+        await dimensions.ensure(type_ids=(device.type_id for device in devices))
+        now = datetime.now()
+        qos = command_send.qos if command_send.qos is not None else self.qos
+        params = json.dumps(command_send.params) if command_send.params is not None else None
+        results: list[CommandResult] = []
+        rows: list[dict] = []
+        accepted: list[CommandResult] = []
+        for device in devices:
+            result = CommandResult(device_id=device.id, serial_number=device.serial_number, status="rejected")
+            results.append(result)
+            if command_send.command not in parse_capabilities(dimensions.capabilities(device.type_id)):
+                result.status_code = 1
+                result.message = "Unsupported command."
+                self.rejected += 1
+                continue
+            rows.append({
+                "device_id": device.id,
+                "command": command_send.command,
+                "params": params,
+                "topic": self.topic(dimensions.type_name(device.type_id), device.serial_number),
+                "qos": qos,
+                "status": "pending",
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.ack_timeout),
+            })
+            accepted.append(result)
+        if not rows:
+            return results
+        # 先落库取得命令 id, 设备确认时按 id 回报
+        query = insert(DeviceCommand).returning(DeviceCommand.id, sort_by_parameter_order=True)
+        ids = list((await db.execute(query, rows)).scalars())
+        await db.commit()
+        loop = asyncio.get_running_loop()
+        waiters = []
+        failed_ids = []
+        for result, row, command_id in zip(accepted, rows, ids):
+            result.command_id = command_id
+            if command_send.wait:
+                self._waiters[command_id] = loop.create_future()
+            payload = json.dumps({"id": command_id, "command": command_send.command, "params": command_send.params})
+            try:
+                mqtt.publish(row["topic"], payload, qos=qos)
+            except Exception as exc:
+                self._waiters.pop(command_id, None)
+                result.status = "failed"
+                result.status_code = 1
+                result.message = str(exc)
+                failed_ids.append(command_id)
+                self.publish_failed += 1
+                continue
+            MQTT_PUBLISHED.inc()
+            self.sent += 1
+            result.status = "pending"
+            if command_send.wait:
+                waiters.append(self._wait(command_id, result))
+        if failed_ids:
+            await db.execute(update(DeviceCommand)
+                             .where(DeviceCommand.id.in_(failed_ids))
+                             .values(status="failed", message="Publish failed.")
+                             .execution_options(synchronize_session=False))
+            await db.commit()
+        # 发布不阻塞, 同时等待全部设备确认
+        await asyncio.gather(*waiters)
+        # 确认可能由其他进程处理, 超时的结果再按库中状态校正一次
+        timed_out = {result.command_id: result for result in accepted if result.status == "timeout"}
+        if timed_out:
+            query = (select(DeviceCommand.id, DeviceCommand.status, DeviceCommand.message)
+                     .where(DeviceCommand.id.in_(list(timed_out)), DeviceCommand.status != "pending"))
+            for row in await db.execute(query):
+                result = timed_out[row.id]
+                result.status = row.status
+                result.status_code = 0 if row.status == "acked" else 1
+                result.message = row.message
+        return results
+
+    async def _wait(self, command_id: int, result: CommandResult):
+        try:
+            result.status, result.message = await asyncio.wait_for(self._waiters[command_id], self.ack_timeout)
+            if result.status != "acked":
+                result.status_code = 1
+        except asyncio.TimeoutError:
+            result.status = "timeout"
+            result.status_code = 1
+            result.message = "Ack timeout."
+        finally:
+            self._waiters.pop(command_id, None)
+
+    async def ack(self, command_ack: CommandAck, device_id: int | None = None) -> bool:
+        # 只接受仍在等待且未超时的命令; 设备回报时只能确认发给自己的命令
+        status = "acked" if command_ack.status == "ok" else "failed"
+        now = datetime.now()
+        filters = [
+            DeviceCommand.id == command_ack.id,
+            DeviceCommand.status == "pending",
+            DeviceCommand.expires_at >= now,
+        ]
+        if device_id is not None:
+            filters.append(DeviceCommand.device_id == device_id)
+        async with AsyncSession(async_engine) as db:
+            query = (update(DeviceCommand)
+                     .where(*filters)
+                     .values(status=status, message=command_ack.message, acked_at=now)
+                     .execution_options(synchronize_session=False))
+            result = await db.execute(query)
+            await db.commit()
+        if not result.rowcount:
+            return False
+        if status == "acked":
+            self.acked += 1
+        else:
+            self.failed += 1
+        waiter = self._waiters.get(command_ack.id)
+        if waiter is not None and not waiter.done():
+            waiter.set_result((status, command_ack.message))
+        return True
+
+    async def ack_message(self, topic: str, payload: bytes) -> bool:
+        # 处理设备通过 MQTT 回报的确认, 非确认主题返回 False
+        wildcards = next((wildcards for wildcards in (match_topic(pattern, topic) for pattern in self.ack_topics)
+                          if wildcards is not None), None)
+        if wildcards is None:
+            return False
+        if not wildcards:
+            print("Command ack topic has no serial number: ", topic)
+            return True
+        try:
+            command_ack = CommandAck.model_validate_json(payload)
+        except ValidationError as exc:
+            print("Invalid command ack: ", topic, exc)
+            return True
+        try:
+            # 主题中最后一个 '+' 层级为回报设备的序列号
+            serial_number = wildcards[-1]
+            async with AsyncSession(async_engine) as db:
+                device = (await resolve_devices(db, [serial_number])).get(serial_number)
+            if device is None:
+                print("Command ack from unknown device: ", topic)
+                return True
+            await self.ack(command_ack, device_id=device[0])
+        except Exception as exc:
+            print("Command ack failed: ", topic, exc)
+        return True
+
+    async def sweep(self) -> int:
+        # 超时未确认的命令置为 timeout
+        async with AsyncSession(async_engine) as db:
+            query = (update(DeviceCommand)
+                     .where(DeviceCommand.status == "pending", DeviceCommand.expires_at < datetime.now())
+                     .values(status="timeout")
+                     .execution_options(synchronize_session=False))
+            result = await db.execute(query)
+            await db.commit()
+        self.timed_out += result.rowcount
+        return result.rowcount
+
+    async def start(self):
+        async with async_engine.begin() as connection:
+            await connection.run_sync(SQLModel.metadata.create_all, tables=[DeviceCommand.__table__])
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as exc:
+                print("Command sweep failed: ", exc)
+
+    def stats(self) -> dict:
+        return {
+            "waiting": len(self._waiters),
+            "sent": self.sent,
+            "rejected": self.rejected,
+            "publish_failed": self.publish_failed,
+            "acked": self.acked,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+        }
+
+
+command_bus = CommandBus(
+    topic_template=settings.COMMAND_TOPIC_TEMPLATE,
+    ack_topics=settings.COMMAND_ACK_TOPICS,
+    qos=settings.COMMAND_QOS,
+    ack_timeout=settings.COMMAND_ACK_TIMEOUT,
+    sweep_interval=settings.COMMAND_SWEEP_INTERVAL,
+)
@@ -0,0 +1,96 @@
+import asyncio
+from typing import Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from config import settings
+from db.operations import async_engine
+from models.device_types import DeviceType
+from models.locations import Location
+from utils.versions import versions
+
+
+class DimensionCache:
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.locations: dict[int, Location] = {}
+        self.device_types: dict[int, DeviceType] = {}
+        self.refreshes = 0
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    async def refresh(self):
+        async with self._lock:
+            async with AsyncSession(async_engine, expire_on_commit=False) as db:
+                locations = (await db.scalars(select(Location).order_by(Location.id))).all()
+                device_types = (await db.scalars(select(DeviceType).order_by(DeviceType.id))).all()
+            # 内容有变化时更新版本号, 使列表的 ETag 失效
+            if [location.model_dump() for location in locations] != [
+                    location.model_dump() for location in self.locations.values()]:
+                versions.bump("locations")
+            if [device_type.model_dump() for device_type in device_types] != [
+                    device_type.model_dump() for device_type in self.device_types.values()]:
+                versions.bump("device_types")
+            # 整体替换, 读取方不会看到更新到一半的数据
+            self.locations = {location.id: location for location in locations}
+            self.device_types = {device_type.id: device_type for device_type in device_types}
+            self.refreshes += 1
+
+    def invalidate(self):
+        self._wakeup.set()
+
+    async def start(self):
+        await self.refresh()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        # 按 TTL 定期刷新, invalidate() 时立即刷新
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.ttl)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.refresh()
+            except Exception as exc:
+                print("Dimension refresh failed: ", exc)
+
+    async def ensure(self, location_ids: Iterable[int | None] = (), type_ids: Iterable[int] = ()):
+        # 出现未知 id 时同步刷新一次, 覆盖后台写入的新位置/类型
+        missing_location = any(location_id is not None and location_id not in self.locations
+                               for location_id in location_ids)
+        missing_type = any(type_id not in self.device_types for type_id in type_ids)
+        if missing_location or missing_type:
+            await self.refresh()
+
+    def location_name(self, location_id: int | None) -> str | None:
+        location = self.locations.get(location_id)
+        return location.name if location is not None else None
+
+    def type_name(self, type_id: int) -> str | None:
+        device_type = self.device_types.get(type_id)
+        return device_type.name if device_type is not None else None
+
+    def capabilities(self, type_id: int) -> str | None:
+        device_type = self.device_types.get(type_id)
+        return device_type.capabilities if device_type is not None else None
+
+    def stats(self) -> dict:
+        return {
+            "locations": len(self.locations),
+            "device_types": len(self.device_types),
+            "refreshes": self.refreshes,
+            "ttl": self.ttl,
+        }
+
+
+dimensions = DimensionCache(ttl=settings.DIMENSION_CACHE_TTL)
@@ -0,0 +1,114 @@
+import csv
+import io
+import json
+import zlib
+from typing import AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine
+from sqlalchemy.sql import Select
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # 可选依赖, 仅 arrow 格式需要
+    pyarrow = None
+
+EXPORT_COLUMNS = ["id", "device_id", "timestamp", "temperature", "humidity", "illuminance", "location_id"]
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+async def _partitions(query: Select, chunk_rows: int, engine: AsyncEngine) -> AsyncIterator[list]:
+    # 服务端游标分批读取, 内存占用与导出范围无关
+    async with AsyncSession(engine) as db:
+        result = await db.stream(query.execution_options(yield_per=chunk_rows))
+        async for partition in result.partitions():
+            yield partition
+
+
+async def _csv_chunks(partitions: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for rows in partitions:
+        for row in rows:
+            writer.writerow([row.timestamp.isoformat() if column == "timestamp" else getattr(row, column)
+                             for column in EXPORT_COLUMNS])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def _ndjson_chunks(partitions: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    async for rows in partitions:
+        lines = []
+        for row in rows:
+            record = dict(row._mapping)
+            record["timestamp"] = record["timestamp"].isoformat()
+            lines.append(json.dumps(record, separators=(",", ":")))
+        yield ("\n".join(lines) + "\n").encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def _arrow_chunks(partitions: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    schema = pyarrow.schema([
+        ("id", pyarrow.int64()),
+        ("device_id", pyarrow.int64()),
+        ("timestamp", pyarrow.timestamp("us")),
+        ("temperature", pyarrow.float64()),
+        ("humidity", pyarrow.float64()),
+        ("illuminance", pyarrow.int64()),
+        ("location_id", pyarrow.int64()),
+    ])
+    sink = _ChunkSink()
+    writer = pyarrow.ipc.new_stream(sink, schema)
+    async for rows in partitions:
+        columns = [[getattr(row, column) for row in rows] for column in EXPORT_COLUMNS]
+        writer.write_batch(pyarrow.record_batch(columns, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+async def export_stream(query: Select, export_format: str, compress: bool, chunk_rows: int,
+                        engine: AsyncEngine) -> AsyncIterator[bytes]:
+    partitions = _partitions(query, chunk_rows, engine)
+    if export_format == "csv":
+        chunks = _csv_chunks(partitions)
+    elif export_format == "ndjson":
+        chunks = _ndjson_chunks(partitions)
+    else:
+        chunks = _arrow_chunks(partitions)
+    if not compress:
+        async for chunk in chunks:
+            yield chunk
+        return
+    # wbits=31 输出 gzip 格式
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
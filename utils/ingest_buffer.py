@@ -0,0 +1,136 @@
+import asyncio
+
+from sqlalchemy.exc import IntegrityError, DataError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db.ingest import write_readings, publish_readings
+from db.operations import async_engine
+
+
+class IngestBuffer:
+    def __init__(self, max_rows: int, interval_ms: int, max_pending: int):
+        self.max_rows = max_rows
+        self.max_pending = max_pending
+        self.interval = interval_ms / 1000
+        self._rows: list[dict] = []
+        # 与 _rows 一一对应, 不等待写入的行为 None
+        self._waiters: list[asyncio.Future | None] = []
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self.failed = 0
+        self.dropped = 0
+
+    async def start(self):
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # 停止定时刷新, 并把剩余数据全部写入
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def put(self, row: dict, wait: bool = False) -> asyncio.Future | None:
+        waiter = asyncio.get_running_loop().create_future() if wait else None
+        self._rows.append(row)
+        self._waiters.append(waiter)
+        if len(self._rows) >= self.max_rows:
+            self._wakeup.set()
+        return waiter
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def full(self) -> bool:
+        return len(self._rows) >= self.max_pending
+
+    async def flush(self):
+        async with self._lock:
+            rows, waiters = self._rows, self._waiters
+            self._rows, self._waiters = [], []
+            if not rows:
+                return
+            try:
+                ids = await self._write(rows)
+            except (IntegrityError, DataError) as exc:
+                # 数据错误发生在提交前, 逐行重试只让出错的行失败
+                print("Ingest flush failed, retrying rows one by one: ", len(rows), exc)
+                await self._write_rows(rows, waiters)
+                return
+            except Exception as exc:
+                print("Ingest flush failed: ", len(rows), exc)
+                self._retry_later(rows, waiters, exc)
+                return
+            publish_readings(rows, ids)
+            for waiter in waiters:
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(None)
+
+    async def _write(self, rows: list[dict]) -> list[int]:
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            return await write_readings(db, rows)
+
+    async def _write_rows(self, rows: list[dict], waiters: list[asyncio.Future | None]):
+        for index, (row, waiter) in enumerate(zip(rows, waiters)):
+            try:
+                ids = await self._write([row])
+            except (IntegrityError, DataError) as exc:
+                self.failed += 1
+                print("Ingest row failed: ", row, exc)
+                if waiter is not None and not waiter.done():
+                    waiter.set_exception(exc)
+                continue
+            except Exception as exc:
+                # 重试过程中数据库不可用, 剩余行按整批失败处理
+                self._retry_later(rows[index:], waiters[index:], exc)
+                return
+            publish_readings([row], ids)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+
+    def _retry_later(self, rows: list[dict], waiters: list[asyncio.Future | None], exc: Exception):
+        # 数据库暂不可用: 等待写入结果的请求直接失败由客户端重试, 已确认的行放回缓冲区下次再写
+        kept = []
+        for row, waiter in zip(rows, waiters):
+            if waiter is None:
+                kept.append(row)
+            elif not waiter.done():
+                waiter.set_exception(exc)
+        self._rows[:0] = kept
+        self._waiters[:0] = [None] * len(kept)
+        # 超过上限时丢弃最旧的行
+        overflow = len(self._rows) - self.max_pending
+        if overflow > 0:
+            del self._rows[:overflow]
+            del self._waiters[:overflow]
+            self.dropped += overflow
+            print("Ingest buffer full, dropped rows: ", overflow)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._rows),
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "max_pending": self.max_pending,
+            "max_rows": self.max_rows,
+            "interval": self.interval,
+        }
+
+
+ingest_buffer = IngestBuffer(
+    max_rows=settings.INGEST_FLUSH_ROWS,
+    interval_ms=settings.INGEST_FLUSH_INTERVAL_MS,
+    max_pending=settings.INGEST_MAX_PENDING_ROWS,
+)
@@ -0,0 +1,37 @@
+from schemas.data_schema import DataList
+
+
+class LatestReadings:
+    def __init__(self):
+        # device_id -> 最新一条数据
+        self._readings: dict[int, dict] = {}
+
+    def update(self, rows: list[dict], ids: list[int]):
+        for row, data_id in zip(rows, ids):
+            current = self._readings.get(row["device_id"])
+            if current is None or (row["timestamp"], data_id) >= (current["timestamp"], current["id"]):
+                self._readings[row["device_id"]] = {**row, "id": data_id}
+
+    def get(self, device_id: int) -> dict | None:
+        return self._readings.get(device_id)
+
+    def pop(self, device_id: int):
+        self._readings.pop(device_id, None)
+
+    def stats(self) -> dict:
+        return {"devices": len(self._readings)}
+
+
+def reading_item(reading: dict, device_name: str, location_name: str) -> DataList:
+    return DataList(
+        id=reading["id"],
+        device_name=device_name,
+        timestamp=reading["timestamp"],
+        temperature=reading["temperature"],
+        humidity=reading["humidity"],
+        illuminance=reading["illuminance"],
+        location_name=location_name,
+    )
+
+
+latest_readings = LatestReadings()
@@ -0,0 +1,127 @@
+import asyncio
+from collections import deque
+from typing import Iterable
+
+from config import settings
+from schemas.data_schema import LiveReading
+from utils.cache import TTLCache
+from utils.dimensions import dimensions
+
+
+class Subscriber:
+    def __init__(self, device_ids: Iterable[int], location_id: int | None, buffer_frames: int):
+        self.device_ids = set(device_ids)
+        self.location_id = location_id
+        # 有界缓冲, 消费过慢时丢弃最旧的帧, 不阻塞写入路径
+        self._frames: deque[str] = deque(maxlen=buffer_frames)
+        self._ready = asyncio.Event()
+        self.delivered = 0
+        self.dropped = 0
+
+    def push(self, frame: str):
+        if len(self._frames) == self._frames.maxlen:
+            self.dropped += 1
+        self._frames.append(frame)
+        self._ready.set()
+
+    async def get(self) -> list[str]:
+        # 等待并一次取出缓冲中的全部帧
+        while not self._frames:
+            self._ready.clear()
+            await self._ready.wait()
+        frames = list(self._frames)
+        self._frames.clear()
+        self.delivered += len(frames)
+        return frames
+
+
+class LiveHub:
+    def __init__(self, buffer_frames: int, max_subscribers: int):
+        self.buffer_frames = buffer_frames
+        self.max_subscribers = max_subscribers
+        # device_id / location_id -> 订阅者, 发布时按行直接查找
+        self._by_device: dict[int, set[Subscriber]] = {}
+        self._by_location: dict[int, set[Subscriber]] = {}
+        self._subscribers: set[Subscriber] = set()
+        # 订阅时预热的设备名称, 不随名称缓存的 TTL 过期
+        self._names: dict[int, str] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, device_ids: Iterable[int], location_id: int | None) -> Subscriber | None:
+        if len(self._subscribers) >= self.max_subscribers:
+            return None
+        subscriber = Subscriber(device_ids, location_id, self.buffer_frames)
+        self._subscribers.add(subscriber)
+        for device_id in subscriber.device_ids:
+            self._by_device.setdefault(device_id, set()).add(subscriber)
+        if location_id is not None:
+            self._by_location.setdefault(location_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber not in self._subscribers:
+            return
+        self._subscribers.discard(subscriber)
+        self.delivered += subscriber.delivered
+        self.dropped += subscriber.dropped
+        for device_id in subscriber.device_ids:
+            subscribers = self._by_device.get(device_id)
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._by_device[device_id]
+        if subscriber.location_id is not None:
+            subscribers = self._by_location.get(subscriber.location_id)
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._by_location[subscriber.location_id]
+
+    def remember_names(self, names: dict[int, str]):
+        self._names.update(names)
+
+    def forget_name(self, device_id: int):
+        self._names.pop(device_id, None)
+
+    def publish(self, rows: list[dict], ids: list[int], device_names: TTLCache):
+        # 写入提交后调用; 名称只取自缓存, 每行只编码一次, 不产生额外查询
+        if not self._subscribers:
+            return
+        for row, data_id in zip(rows, ids):
+            subscribers = self._by_device.get(row["device_id"], set()) | self._by_location.get(row["location_id"], set())
+            if not subscribers:
+                continue
+            device_name = device_names.get(row["device_id"])
+            if device_name is None:
+                device_name = self._names.get(row["device_id"])
+            else:
+                self._names[row["device_id"]] = device_name
+            frame = LiveReading.model_construct(
+                id=data_id,
+                device_id=row["device_id"],
+                device_name=device_name,
+                timestamp=row["timestamp"],
+                temperature=row["temperature"],
+                humidity=row["humidity"],
+                illuminance=row["illuminance"],
+                location_id=row["location_id"],
+                location_name=dimensions.location_name(row["location_id"]),
+            ).model_dump_json()
+            for subscriber in subscribers:
+                subscriber.push(frame)
+            self.published += 1
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered + sum(subscriber.delivered for subscriber in self._subscribers),
+            "dropped": self.dropped + sum(subscriber.dropped for subscriber in self._subscribers),
+            "buffer_frames": self.buffer_frames,
+        }
+
+
+live_hub = LiveHub(
+    buffer_frames=settings.LIVE_BUFFER_FRAMES,
+    max_subscribers=settings.LIVE_MAX_SUBSCRIBERS,
+)
@@ -0,0 +1,194 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable
+
+from sqlalchemy import event
+
+from db.operations import engines
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [各桶计数, 总和, 次数]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            entry[0][index] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.labels, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = _format_labels(self.labels, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+        # (前缀, 统计函数, 标签名): 将各组件已有的 stats() 导出为 gauge
+        self._collectors: list[tuple[str, Callable[[], dict], str | None]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix: str, func: Callable[[], dict], label: str | None = None):
+        self._collectors.append((prefix, func, label))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for prefix, func, label in self._collectors:
+            stats = func()
+            groups = stats.items() if label else [(None, stats)]
+            for group, values in groups:
+                if not isinstance(values, dict):
+                    continue
+                for key, value in values.items():
+                    if isinstance(value, bool) or not isinstance(value, (int, float)):
+                        continue
+                    labels = f'{{{label}="{_escape(str(group))}"}}' if label else ""
+                    lines.append(f"{prefix}_{key}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status.", ("method", "route", "status")))
+HTTP_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route")))
+REQUEST_DB_QUERIES = registry.register(Histogram(
+    "http_request_db_queries", "Database queries per HTTP request.", ("method", "route"), QUERY_COUNT_BUCKETS))
+REQUEST_DB_SECONDS = registry.register(Histogram(
+    "http_request_db_seconds", "Database time per HTTP request.", ("method", "route")))
+DB_QUERIES = registry.register(Counter(
+    "db_queries_total", "Database queries by engine.", ("engine",)))
+DB_QUERY_SECONDS = registry.register(Histogram(
+    "db_query_duration_seconds", "Database query latency by engine.", ("engine",)))
+MQTT_RECEIVED = registry.register(Counter(
+    "mqtt_messages_received_total", "MQTT messages received.", ("kind",)))
+MQTT_PUBLISHED = registry.register(Counter(
+    "mqtt_messages_published_total", "MQTT messages published."))
+
+
+class _RequestDb:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_request_db: ContextVar[_RequestDb | None] = ContextVar("request_db", default=None)
+
+
+class MetricsMiddleware:
+    # 纯 ASGI 中间件, 避免 BaseHTTPMiddleware 的额外开销
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+        request_db = _RequestDb()
+        token = _request_db.set(request_db)
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            _request_db.reset(token)
+            route = scope.get("route")
+            labels = (scope["method"], route.path if route is not None else "unmatched")
+            HTTP_REQUESTS.inc(labels + (status,))
+            HTTP_LATENCY.observe(labels, time.perf_counter() - start)
+            REQUEST_DB_QUERIES.observe(labels, request_db.queries)
+            REQUEST_DB_SECONDS.observe(labels, request_db.seconds)
+
+
+def instrument_engines():
+    for name, (engine, _) in engines.items():
+        _listen_queries(name, engine.sync_engine)
+
+
+def _listen_queries(name: str, sync_engine):
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERIES.inc((name,))
+        DB_QUERY_SECONDS.observe((name,), elapsed)
+        request_db = _request_db.get()
+        if request_db is not None:
+            request_db.queries += 1
+            request_db.seconds += elapsed
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
@@ -0,0 +1,15 @@
+from fastapi_mqtt import FastMQTT, MQTTConfig
+
+from config import settings
+
+mqtt_config = MQTTConfig(
+    host=settings.MQTT_HOST,
+    port=settings.MQTT_PORT,
+    ssl=settings.MQTT_SSL,
+    username=settings.MQTT_USERNAME,
+    password=settings.MQTT_PASSWORD,
+    reconnect_retries=settings.MQTT_RECONNECT_RETRIES,
+    reconnect_delay=settings.MQTT_RECONNECT_DELAY
+)
+
+mqtt = FastMQTT(config=mqtt_config)
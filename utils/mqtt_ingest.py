@@ -0,0 +1,145 @@
+import asyncio
+import time
+from datetime import datetime
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db.ingest import resolve_devices, insert_readings
+from db.operations import async_engine
+from schemas.device_schema import LTHData
+
+
+def match_topic(pattern: str, topic: str) -> list[str] | None:
+    # MQTT 通配符匹配, 返回 '+' 位置对应的层级
+    pattern_levels = pattern.split("/")
+    topic_levels = topic.split("/")
+    wildcards = []
+    for index, level in enumerate(pattern_levels):
+        if level == "#":
+            return wildcards
+        if index >= len(topic_levels):
+            return None
+        if level == "+":
+            wildcards.append(topic_levels[index])
+        elif level != topic_levels[index]:
+            return None
+    if len(pattern_levels) != len(topic_levels):
+        return None
+    return wildcards
+
+
+class MqttIngest:
+    def __init__(self, topics: list[str], queue_size: int, workers: int, batch_rows: int):
+        self.topics = topics
+        self.workers = workers
+        self.batch_rows = batch_rows
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: list[asyncio.Task] = []
+        self.received = 0
+        self.invalid = 0
+        self.dropped = 0
+        self.unknown_device = 0
+        self.inserted = 0
+        self.failed = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def serial_number(self, topic: str) -> str | None:
+        for pattern in self.topics:
+            wildcards = match_topic(pattern, topic)
+            if wildcards:
+                return wildcards[0]
+        return None
+
+    def submit(self, topic: str, payload: bytes) -> bool:
+        serial_number = self.serial_number(topic)
+        if serial_number is None:
+            return False
+        self.received += 1
+        try:
+            data = LTHData.model_validate_json(payload)
+        except ValidationError:
+            self.invalid += 1
+            return True
+        # 队列满说明数据库写入跟不上, 丢弃并计数
+        try:
+            self.queue.put_nowait((time.monotonic(), serial_number, datetime.now(), data))
+        except asyncio.QueueFull:
+            self.dropped += 1
+        return True
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # 等待队列排空后再停止 worker
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_rows:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                await self._write(batch)
+            except Exception as exc:
+                self.failed += len(batch)
+                print("MQTT ingest failed: ", len(batch), exc)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _write(self, batch: list[tuple]):
+        self.last_lag = time.monotonic() - batch[0][0]
+        self.max_lag = max(self.max_lag, self.last_lag)
+        async with AsyncSession(async_engine, expire_on_commit=False) as db:
+            devices = await resolve_devices(db, (serial_number for _, serial_number, _, _ in batch))
+            rows = []
+            for _, serial_number, timestamp, data in batch:
+                device = devices.get(serial_number)
+                if device is None:
+                    self.unknown_device += 1
+                    continue
+                device_id, location_id = device
+                rows.append({
+                    "device_id": device_id,
+                    "timestamp": timestamp,
+                    "temperature": data.temp,
+                    "humidity": data.humi,
+                    "illuminance": data.lux,
+                    "location_id": location_id,
+                })
+            await insert_readings(db, rows)
+            self.inserted += len(rows)
+
+    def stats(self) -> dict:
+        return {
+            "topics": self.topics,
+            "queued": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "received": self.received,
+            "invalid": self.invalid,
+            "dropped": self.dropped,
+            "unknown_device": self.unknown_device,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+        }
+
+
+mqtt_ingest = MqttIngest(
+    topics=settings.MQTT_SENSOR_TOPICS,
+    queue_size=settings.MQTT_INGEST_QUEUE_SIZE,
+    workers=settings.MQTT_INGEST_WORKERS,
+    batch_rows=settings.MQTT_INGEST_BATCH_ROWS,
+)
@@ -0,0 +1,123 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_, desc, func, and_, literal, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from config import settings
+from schemas.pagination_schema import PaginatedRequest
+from utils.cache import TTLCache
+from utils.versions import versions
+
+count_cache = TTLCache(maxsize=settings.COUNT_CACHE_SIZE, ttl=settings.COUNT_CACHE_TTL)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    raise TypeError(f"Unsupported cursor value: {value!r}")
+
+
+def _decode_value(value: dict):
+    if "$dt" in value:
+        return datetime.fromisoformat(value["$dt"])
+    return value
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps(values, default=_encode_value, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> list:
+    # 非法游标统一抛出 ValueError
+    padded = token + "=" * (-len(token) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()), object_hook=_decode_value)
+    except TypeError:
+        raise ValueError("Invalid cursor.")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor.")
+    return values
+
+
+def _check_cursor_value(key, value):
+    # 游标值类型必须与键列一致, 否则交给数据库会得到空页或类型错误
+    try:
+        python_type = key.type.python_type
+    except NotImplementedError:
+        return
+    if isinstance(value, bool) or not isinstance(value, python_type):
+        raise ValueError("Invalid cursor.")
+
+
+def apply_page(query: Select, pagination: PaginatedRequest, *keys, descending: bool = False) -> Select:
+    # 有 after 游标时按 keyset 分页, 否则沿用 offset 分页
+    if descending:
+        query = query.order_by(*(desc(key) for key in keys))
+    else:
+        query = query.order_by(*keys)
+    if pagination.after is not None:
+        values = decode_cursor(pagination.after)
+        if len(values) != len(keys):
+            raise ValueError("Invalid cursor.")
+        for key, value in zip(keys, values):
+            _check_cursor_value(key, value)
+        # 额外的首列范围条件便于索引范围扫描和分区裁剪
+        if descending:
+            query = query.where(keys[0] <= values[0], tuple_(*keys) < tuple_(*values))
+        else:
+            query = query.where(keys[0] >= values[0], tuple_(*keys) > tuple_(*values))
+    else:
+        query = query.offset((pagination.page - 1) * pagination.size)
+    return query.limit(pagination.size)
+
+
+def next_cursor(rows: list, size: int, *attrs: str) -> str | None:
+    if not rows or len(rows) < size:
+        return None
+    last = rows[-1]
+    return encode_cursor(*(getattr(last, attr) for attr in attrs))
+
+
+async def _estimate_total(db: AsyncSession, table, filters: list) -> int:
+    # 无过滤条件直接读 pg_class 统计信息, 否则取 EXPLAIN 的估计行数
+    if not filters:
+        query = text("SELECT reltuples FROM pg_class WHERE oid = CAST(:name AS regclass)")
+        reltuples = (await db.execute(query, {"name": table.__tablename__})).scalar_one_or_none()
+        if reltuples is not None and reltuples >= 0:
+            return int(reltuples)
+    query = select(literal(1)).select_from(table).where(and_(*filters))
+    sql = str(query.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True}))
+    connection = await db.connection()
+    plan = (await connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql)).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def count_total(db: AsyncSession, table, filters: list, mode: str) -> tuple[int | None, bool]:
+    # 返回 (总数, 是否精确)
+    if mode == "none":
+        return None, False
+    if mode == "estimated":
+        return await _estimate_total(db, table, filters), False
+    query = (select(func.count())
+             .select_from(table)
+             .where(and_(*filters)))
+    compiled = query.compile()
+    # 键中带上表版本, 表变更后不会与新 ETag 一起返回旧的总数
+    key = (str(compiled), tuple(sorted(compiled.params.items())), versions.version(table.__tablename__))
+    total = count_cache.get(key)
+    if total is None:
+        total = (await db.execute(query)).scalar_one()
+        count_cache.set(key, total)
+    return total, True
+
+
+def total_pages(total: int | None, size: int) -> int | None:
+    if total is None:
+        return None
+    return (total + size - 1) // size
@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import update, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db.operations import async_engine
+from models.devices import Device
+from utils.versions import versions
+
+
+class PresenceTracker:
+    def __init__(self, flush_interval: float, offline_timeout: float):
+        self.flush_interval = flush_interval
+        self.offline_timeout = offline_timeout
+        # device_id -> 待写入的心跳状态, 同一设备多次心跳只保留最后一次
+        self._dirty: dict[int, dict] = {}
+        self._task: asyncio.Task | None = None
+        self.heartbeats = 0
+        self.flushed = 0
+        self.marked_offline = 0
+
+    def heartbeat(self, device_id: int, firmware_version: str | None, is_online: bool):
+        self.heartbeats += 1
+        self._dirty[device_id] = {
+            "id": device_id,
+            "firmware_version": firmware_version,
+            "last_online": datetime.now(),
+            "is_online": is_online,
+        }
+
+    async def flush(self) -> int:
+        dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return 0
+        try:
+            async with AsyncSession(async_engine) as db:
+                # 按主键批量 UPDATE, 按 id 排序避免并发死锁
+                await db.execute(update(Device), [dirty[device_id] for device_id in sorted(dirty)])
+                await db.commit()
+        except Exception:
+            # 写入失败时放回, 不覆盖期间收到的新心跳; 已删除的设备不再放回, 否则每轮都会失败
+            existing = await self._existing(dirty)
+            for device_id, values in dirty.items():
+                if existing is None or device_id in existing:
+                    self._dirty.setdefault(device_id, values)
+            raise
+        versions.bump("devices")
+        self.flushed += len(dirty)
+        return len(dirty)
+
+    async def _existing(self, device_ids) -> set[int] | None:
+        try:
+            async with AsyncSession(async_engine) as db:
+                result = await db.execute(select(Device.id).where(Device.id.in_(list(device_ids))))
+                return set(result.scalars())
+        except Exception:
+            return None
+
+    def forget(self, device_id: int):
+        self._dirty.pop(device_id, None)
+
+    async def sweep(self) -> int:
+        # 超时未上报心跳的设备置为离线
+        deadline = datetime.now() - timedelta(seconds=self.offline_timeout)
+        async with AsyncSession(async_engine) as db:
+            query = (update(Device)
+                     .where(Device.is_online == True, Device.last_online < deadline)
+                     .values(is_online=False)
+                     .execution_options(synchronize_session=False))
+            result = await db.execute(query)
+            await db.commit()
+        if result.rowcount:
+            versions.bump("devices")
+        self.marked_offline += result.rowcount
+        return result.rowcount
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # 两步互不影响, 写入心跳失败时仍要判定离线
+            try:
+                await self.flush()
+            except Exception as exc:
+                print("Presence flush failed: ", exc)
+            try:
+                await self.sweep()
+            except Exception as exc:
+                print("Presence sweep failed: ", exc)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._dirty),
+            "heartbeats": self.heartbeats,
+            "flushed": self.flushed,
+            "marked_offline": self.marked_offline,
+            "flush_interval": self.flush_interval,
+            "offline_timeout": self.offline_timeout,
+        }
+
+
+presence = PresenceTracker(
+    flush_interval=settings.PRESENCE_FLUSH_INTERVAL,
+    offline_timeout=settings.DEVICE_OFFLINE_TIMEOUT,
+)
@@ -0,0 +1,52 @@
+import functools
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.responses import Response
+
+from config import settings
+
+try:
+    import orjson
+except ImportError:  # 未安装时退回标准库 json
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        # 已校验的响应模型直接由 pydantic-core 序列化
+        if isinstance(content, BaseModel):
+            return content.model_dump_json().encode()
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return super().render(content)
+
+
+class FastRoute(APIRoute):
+    # 处理函数返回的对象类型与 response_model 完全一致时, 跳过 FastAPI 的二次校验直接输出;
+    # 其他情况(如未参数化的 Responses)仍走原有的校验与字段过滤
+    def get_route_handler(self):
+        if settings.FAST_RESPONSES and self.response_model is not None and not getattr(self, "_fast", False):
+            self._fast = True
+            endpoint = self.dependant.call
+            response_model = self.response_model
+
+            @functools.wraps(endpoint)
+            async def call(**kwargs):
+                result = await endpoint(**kwargs)
+                if type(result) is not response_model:
+                    return result
+                response = FastJSONResponse(result)
+                # 保留处理函数通过 Response 参数设置的状态码和响应头
+                for value in kwargs.values():
+                    if isinstance(value, Response):
+                        if value.status_code:
+                            response.status_code = value.status_code
+                        response.raw_headers.extend(value.headers.raw)
+                        break
+                return response
+
+            self.dependant.call = call
+        return super().get_route_handler()
@@ -0,0 +1,73 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db.operations import async_engine
+from db.rollups import accumulate, upsert_rollups
+from models.rollups import ROLLUPS
+
+
+class RollupAggregator:
+    def __init__(self, interval_ms: int):
+        self.interval = interval_ms / 1000
+        # 写入提交后送入的原始行, 由单个后台任务合并写入汇总表
+        self._rows: list[dict] = []
+        # 汇总表模型 -> 待写入的合并结果, 写入失败时保留到下次
+        self._groups: dict[type, dict[tuple, dict]] = {}
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self.rows = 0
+        self.flushes = 0
+        self.failed = 0
+
+    def add(self, rows: list[dict]):
+        self._rows.extend(rows)
+
+    async def flush(self):
+        async with self._lock:
+            rows, self._rows = self._rows, []
+            for width, model in ROLLUPS:
+                accumulate(self._groups.setdefault(model, {}), rows, width)
+            if not any(self._groups.values()):
+                return
+            try:
+                async with AsyncSession(async_engine) as db:
+                    await upsert_rollups(db, self._groups)
+                    await db.commit()
+            except Exception:
+                self.failed += 1
+                raise
+            self._groups = {}
+            self.rows += len(rows)
+            self.flushes += 1
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as exc:
+                print("Rollup flush failed: ", exc)
+
+    def stats(self) -> dict:
+        return {
+            "pending_rows": len(self._rows),
+            "pending_groups": sum(len(groups) for groups in self._groups.values()),
+            "rows": self.rows,
+            "flushes": self.flushes,
+            "failed": self.failed,
+        }
+
+
+rollup_aggregator = RollupAggregator(interval_ms=settings.ROLLUP_FLUSH_INTERVAL_MS)
@@ -1,28 +1,89 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
 from typing import Optional
 
+import bcrypt
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
 
 from config import settings
 from db.operations import get_db
 from models.users import User
+from utils.cache import TTLCache
 
-# todo 替换passlib
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt 计算在独立线程池中执行, 避免阻塞事件循环
+_hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_hash_stats = {"pending": 0, "completed": 0, "wait_total": 0.0, "wait_max": 0.0}
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/utils/token")
+# username -> User, 用户信息变更时需调用 invalidate_user
+principal_cache = TTLCache(maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL)
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def invalidate_user(*usernames: str):
+    for username in usernames:
+        principal_cache.pop(username)
 
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def _password_bytes(password: str) -> bytes:
+    # bcrypt 只使用前 72 字节, 与 passlib 的截断行为保持一致
+    return password.encode()[:72]
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return bcrypt.checkpw(_password_bytes(plain_password), hashed_password.encode())
+    except ValueError:
+        return False
+
+
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(_password_bytes(password), bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)).decode()
+
+
+async def _run_hash(func, *args):
+    submitted = time.perf_counter()
+
+    def job():
+        return time.perf_counter() - submitted, func(*args)
+
+    _hash_stats["pending"] += 1
+    try:
+        wait, result = await asyncio.get_running_loop().run_in_executor(_hash_executor, job)
+    finally:
+        _hash_stats["pending"] -= 1
+    _hash_stats["completed"] += 1
+    _hash_stats["wait_total"] += wait
+    _hash_stats["wait_max"] = max(_hash_stats["wait_max"], wait)
+    return result
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hash(_verify, plain_password, hashed_password)
+
+
+async def get_password_hash(password: str) -> str:
+    return await _run_hash(_hash, password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    # $2b$<cost>$..., cost 与当前配置不一致时需要重新计算
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def hash_stats() -> dict:
+    return {
+        **_hash_stats,
+        "workers": settings.PASSWORD_HASH_WORKERS,
+        "rounds": settings.BCRYPT_ROUNDS,
+    }
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -50,8 +111,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     except JWTError:
         raise credentials_exception
 
-    query = select(User).where(User.username == username)
-    user = (await db.scalars(query)).first()
+    user = principal_cache.get(username)
     if user is None:
-        raise credentials_exception
+        query = select(User).where(User.username == username)
+        user = (await db.scalars(query)).first()
+        if user is None:
+            raise credentials_exception
+        principal_cache.set(username, user)
     return user
@@ -0,0 +1,72 @@
+import hashlib
+import time
+import uuid
+from email.utils import formatdate
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+
+from config import settings
+from db.operations import read_engine
+
+
+class TableVersions:
+    def __init__(self):
+        # 进程启动标识, 重启后旧的 ETag 全部失效
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.boot_time = time.time()
+        self._versions: dict[str, int] = {}
+        self._modified: dict[str, float] = {}
+        self.not_modified = 0
+        self.modified = 0
+
+    def bump(self, *tables: str):
+        now = time.time()
+        for table in tables:
+            self._versions[table] = self._versions.get(table, 0) + 1
+            self._modified[table] = now
+
+    def version(self, table: str) -> int:
+        return self._versions.get(table, 0)
+
+    def last_modified(self, tables: tuple[str, ...]) -> float:
+        return max(self._modified.get(table, self.boot_time) for table in tables)
+
+    def etag(self, tables: tuple[str, ...], key: str) -> str:
+        # 版本号相同但查询参数不同的列表页需要不同的 ETag
+        versions = ".".join(str(self._versions.get(table, 0)) for table in tables)
+        digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+        return f'W/"{self.boot_id}-{versions}-{digest}"'
+
+    def stats(self) -> dict:
+        return {
+            "not_modified": self.not_modified,
+            "modified": self.modified,
+            **{f"{table}_version": version for table, version in self._versions.items()},
+        }
+
+
+versions = TableVersions()
+
+
+def not_modified(request: Request, response: Response, *tables: str, replica: bool = False) -> Response | None:
+    # 数据来自从库时, 变更后的复制延迟窗口内不下发 ETag, 避免客户端缓存旧数据后一直收到 304
+    last_modified = versions.last_modified(tables)
+    if replica and read_engine is not None and time.time() - last_modified < settings.REPLICA_MAX_LAG:
+        versions.modified += 1
+        return None
+    query = urlencode(sorted(request.query_params.multi_items()))
+    etag = versions.etag(tables, f"{request.url.path}?{query}")
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(last_modified, usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*"
+                          or etag in (tag.strip() for tag in if_none_match.split(","))):
+        versions.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    versions.modified += 1
+    response.headers.update(headers)
+    return None